@@ -10,18 +10,28 @@ import asyncio
 import datetime
 import logging
 import random
-import re
 import sys
+import time
 import traceback
+from collections import Counter
 
 import discord
 from discord.ext import commands
 from discord.ext.commands.view import StringView
 
 import config
+from cogs.utils.checks import PermissionCache
 from cogs.utils.config import Config
 from cogs.utils.context import Context
+from cogs.utils.http import HTTPClient
+from cogs.utils.images import AssetCache, AvatarCache, Renderer
+from cogs.utils.lockdown import LockdownStore
 from cogs.utils.paginator import CannotPaginate
+from cogs.utils.policy import ServiceUnavailable, Services
+from cogs.utils.prefix import PrefixMatcher
+from cogs.utils.reddit import RedditWorker
+from cogs.utils.router import MessageRouter
+from cogs.utils.stats import Metrics
 
 description = "I'm a bot that does stuff"
 
@@ -44,10 +54,17 @@ initial_extensions = [
     'cogs.bostonlib',
     'cogs.custom',
     'cogs.logging',
-    'cogs.tracking'
+    'cogs.tracking',
+    'cogs.stats'
 ]
 
 
+def make_reddit():
+    # only pay for the import and the praw.ini parse if it's used
+    import praw
+    return praw.Reddit('main', user_agent='ToR Discord Bot')
+
+
 def _prefix(bot, msg):
     user_id = bot.user.id
 
@@ -65,7 +82,7 @@ def _prefix(bot, msg):
 
 
 class TorGenius(commands.Bot):
-    def __init__(self):
+    def __init__(self, *, reddit=True):
         super().__init__(
             command_prefix=_prefix,
             description=description,
@@ -81,11 +98,47 @@ class TorGenius(commands.Bot):
 
         self.token = 'A dead meme'
 
-        self.lockdown = {}
+        self.lockdown = LockdownStore()
+        self.lockdown_task = self.loop.create_task(
+            self.lockdown.expire_forever()
+        )
+
+        # set by the launcher
+        self.pool = None
+        self.pool_stats = Counter()
+
+        self.metrics = Metrics()
+        self.permission_cache = PermissionCache()
+
+        # rate limits and circuit breakers for everything we call out to
+        self.services = Services()
+
+        # shared by every cog, closed in close()
+        self.web = HTTPClient(loop=self.loop, services=self.services)
+
+        # all the Pillow work happens on here instead of the event loop
+        self.renderer = Renderer(loop=self.loop)
+        self.avatars = AvatarCache('cache/avatars', loop=self.loop)
+        self.assets = AssetCache('assets')
+
+        # cogs register their message listeners here instead of on_message
+        self.router = MessageRouter(self)
 
         self.prefixes = Config('prefixes.json')
+        self._prefix_matchers = {}
+
+        # created on first use, see the reddit property
+        self.reddit_enabled = reddit
+        self._reddit = None
+        self.reddit_worker = RedditWorker(
+            make_reddit, loop=self.loop, service=self.services['reddit'],
+            background_service=self.services['reddit_background']
+        ) if reddit else None
 
         for extension in initial_extensions:
+            if extension == 'cogs.reddit' and not reddit:
+                continue
+
             # noinspection PyBroadException
             try:
                 self.load_extension(extension)
@@ -98,6 +151,18 @@ class TorGenius(commands.Bot):
     def config(self):
         return __import__('config')
 
+    @property
+    def reddit(self):
+        """The event loop's Reddit client, created lazily. Don't pass it to
+        reddit_worker, each of its threads has its own."""
+        if not self.reddit_enabled:
+            raise RuntimeError('Reddit is disabled on this bot.')
+
+        if self._reddit is None:
+            self._reddit = make_reddit()
+
+        return self._reddit
+
     async def on_command_error(self, ctx, error):
 
         if isinstance(error, commands.NoPrivateMessage):
@@ -128,8 +193,10 @@ class TorGenius(commands.Bot):
             )
         elif isinstance(error, CannotPaginate):
             await ctx.send(error)
+        elif isinstance(error, ServiceUnavailable):
+            await ctx.send(error)
         elif isinstance(error, commands.CheckFailure):
-            if self.lockdown.get(ctx.channel, None):
+            if ctx.channel.id in self.lockdown:
                 return
             if ctx.command.name == 'calc':
                 return await ctx.send(f'You are not allowed to use this '
@@ -170,6 +237,9 @@ class TorGenius(commands.Bot):
                 sorted(prefixes, reverse=True, key=lambda p: p[0])
             )
 
+        # rebuilt lazily on the next message from this guild
+        self._prefix_matchers.pop(guild.id, None)
+
     async def on_ready(self):
         print(f'Ready: {self.user} (ID: {self.user.id})')
 
@@ -183,6 +253,45 @@ class TorGenius(commands.Bot):
             game=(discord.Game(name=game))
         )
 
+    # Anything that can change someone's permissions invalidates the guild's
+    # cached permissions
+
+    async def on_guild_update(self, _, after):
+        self.permission_cache.invalidate(after)
+
+    async def on_guild_role_update(self, _, after):
+        self.permission_cache.invalidate(after.guild)
+
+    async def on_guild_role_delete(self, role):
+        self.permission_cache.invalidate(role.guild)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.overwrites != after.overwrites:
+            self.permission_cache.invalidate(after.guild)
+
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.permission_cache.invalidate(after.guild)
+
+    # someone who leaves and comes back doesn't get their roles back
+
+    async def on_member_join(self, member):
+        self.permission_cache.invalidate(member.guild)
+
+    async def on_member_remove(self, member):
+        self.permission_cache.invalidate(member.guild)
+
+    def get_prefix_matcher(self, guild):
+        """Get the compiled prefix matcher for a guild, or DMs if ``None``"""
+        key = guild.id if guild is not None else None
+
+        try:
+            return self._prefix_matchers[key]
+        except KeyError:
+            matcher = PrefixMatcher(self.get_guild_prefixes(guild))
+            self._prefix_matchers[key] = matcher
+            return matcher
+
     async def get_context(self, message, *, cls=Context):
         view = StringView(message.content)
         ctx = cls(prefix=None, view=view, bot=self, message=message)
@@ -190,67 +299,42 @@ class TorGenius(commands.Bot):
         if self._skip_check(message.author.id, self.user.id):
             return ctx
 
-        prefix = await self.get_prefix(message)
-        invoked_prefix = prefix
-
-        if isinstance(prefix, str):
-            if not view.skip_string(prefix):
-                return ctx
-        elif isinstance(prefix, list) \
-                and any([isinstance(p, list) for p in prefix]):
-            # Regex time
-            for p in prefix:
-                if isinstance(p, list):
-                    if p[1]:
-                        # regex prefix parsing
-                        reg = re.match(p[0], message.content)
-                        if reg:
-
-                            if message.content == reg.groups()[0]:
-                                # ignore * prefixes
-                                continue
-
-                            # Matches, this is the prefix
-                            invoked_prefix = p
-
-                            # redo the string view with the capture group
-                            view = StringView(reg.groups()[0])
-
-                            invoker = view.get_word()
-                            ctx.invoked_with = invoker
-                            ctx.prefix = invoked_prefix
-                            ctx.command = self.all_commands.get(invoker)
-                            ctx.view = view
-                            return ctx
-                    else:
-                        # regex has highest priority or something idk
-                        # what I'm doing help
-                        continue
-
-            # No prefix found, use the branch below
-            prefix = [p[0] for p in prefix if not p[1]]
-            invoked_prefix = discord.utils.find(view.skip_string, prefix)
-            if invoked_prefix is None:
-                return ctx
-        else:
-            invoked_prefix = discord.utils.find(view.skip_string, prefix)
-            if invoked_prefix is None:
-                return ctx
+        start = time.perf_counter()
+        result = self.get_prefix_matcher(message.guild).match(message.content)
+        ctx.timings['prefix'] = time.perf_counter() - start
+
+        if result is None:
+            return ctx
+
+        ctx.prefix, ctx.view = result
 
-        invoker = view.get_word()
+        invoker = ctx.view.get_word()
         ctx.invoked_with = invoker
-        ctx.prefix = invoked_prefix
         ctx.command = self.all_commands.get(invoker)
         return ctx
 
+    # noinspection PyProtectedMember
     async def process_commands(self, message):
         ctx = await self.get_context(message, cls=Context)
 
         if ctx.command is None:
             return
 
-        async with ctx.acquire(ctx, None):
+        # ctx.db only takes a connection from the pool if a query runs
+        try:
             await self.invoke(ctx)
+        finally:
+            if ctx._db is None:
+                self.pool_stats['skipped'] += 1
+            await ctx.release()
+
+    async def invoke(self, ctx):
+        start = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            if ctx.command is not None:
+                self.metrics.record(ctx, time.perf_counter() - start)
 
     async def get_prefix(self, message):
         prefix = ret = self.command_prefix
@@ -262,10 +346,20 @@ class TorGenius(commands.Bot):
         return ret
 
     async def on_message(self, message):
+        self.router.dispatch(message)
+
         if message.author.bot:
             return
         await self.process_commands(message)
 
+    async def close(self):
+        self.lockdown_task.cancel()
+        await self.web.close()
+        self.renderer.close()
+        if self.reddit_worker is not None:
+            self.reddit_worker.close()
+        await super().close()
+
     def run(self):
         super().run(config.token, reconnect=True)
 
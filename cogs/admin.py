@@ -22,7 +22,6 @@ import time
 import traceback
 from contextlib import redirect_stdout
 
-import aiohttp
 import discord
 from discord.ext import commands
 from texttable import Texttable
@@ -50,26 +49,24 @@ async def run_subprocess(cmd, loop=None):
     return [s.decode('utf8') for s in res]
 
 
-async def haste_upload(text):
+async def haste_upload(web, text):
     text = str(text)
-    with aiohttp.ClientSession() as session:
-        async with session.post('https://hastebin.com/documents/', data=text,
-                                headers={'Content-Type': 'text/plain'}) as r:
-            r = await r.json()
-            return f'https://hastebin.com/{r["key"]}'
+    r = await web.post('https://hastebin.com/documents/', data=text,
+                       headers={'Content-Type': 'text/plain'},
+                       service='hastebin')
+    return f'https://hastebin.com/{r.json()["key"]}'
 
 
-async def gist_upload(files, public=False, description=''):
+async def gist_upload(web, files, public=False, description=''):
     description = str(description)
     data = {
         'description': description,
         'public': public,
         'files': files
     }
-    with aiohttp.ClientSession() as session:
-        async with session.post('https://api.github.com/gists', json=data) as r:
-            json = await r.json()
-            return json['html_url']
+    r = await web.post('https://api.github.com/gists', json=data,
+                       service='github')
+    return r.json()['html_url']
 
 
 class Admin:
@@ -129,6 +126,7 @@ class Admin:
                     self.messages[ctx.message.id] = (ctx.message, m)
                 except discord.HTTPException:
                     key = await gist_upload(
+                        self.bot.web,
                         {f'in.{file_type}': {'content': inp},
                          f'out.{file_type}': {'content': content}})
                     m = await ctx.send(key)
@@ -142,14 +140,15 @@ class Admin:
                 self.messages[ctx.message.id] = (ctx.message, m)
             except discord.HTTPException:
                 key = await gist_upload(
+                    self.bot.web,
                     {f'in.{file_type}': {'content': inp},
                      f'out.{file_type}': {'content': content + extra}})
                 m = await ctx.send(key)
                 self.messages[ctx.message.id] = (ctx.message, m)
 
-    async def __local_check(self, ctx):
-        k = await self.bot.is_owner(ctx.author)
-        return k
+    @staticmethod
+    async def __local_check(ctx):
+        return await ctx.bot.is_owner(ctx.author)
 
     @staticmethod
     def get_syntax_error(e):
@@ -461,8 +460,10 @@ class Admin:
 
         new_ctx = await self.bot.get_context(fake_msg, cls=Context)
 
-        async with new_ctx.acquire(new_ctx, None):
+        try:
             await self.bot.invoke(new_ctx)
+        finally:
+            await new_ctx.release()
 
     # the following code is used with permissions from ry00001#3487.
     # https://github.com/ry00001/Erio/blob/master/extensions/eshell.py
@@ -554,7 +555,9 @@ class Admin:
                         item,
                         history[item])
 
-                haste_url = await haste_upload(history_string)
+                haste_url = await haste_upload(
+                    self.bot.web, history_string
+                )
                 return_msg = f"[`Leaving shell session. History hosted on " \
                              f"hastebin.`]({haste_url}) "
 
@@ -593,7 +596,9 @@ class Admin:
                     if len(cleaned) > 800:
                         cleaned = "<Too big to be printed>"
                     if len(return_msg) > 800:
-                        haste_url = await haste_upload(return_msg)
+                        haste_url = await haste_upload(
+                            self.bot.web, return_msg
+                        )
                         return_msg = f'[`SyntaxError too big to be printed. ' \
                                      f'Hosted on hastebin.`]({haste_url}) '
 
@@ -647,7 +652,7 @@ class Admin:
             try:
                 if fmt is not None:
                     if len(fmt) >= 800:
-                        haste_url = await haste_upload(fmt)
+                        haste_url = await haste_upload(self.bot.web, fmt)
                         self.repl_embeds[shell].add_field(
                             name="`>>> {}`".format(cleaned),
                             value=f"[`Content too big to be printed. Hosted "
@@ -767,7 +772,7 @@ class Admin:
 
         fmt = f'```\n{render}\n```\n*Returned {Plural(row=rows)} in {dt:.2f}ms*'
         if len(fmt) > 2000:
-            await ctx.send((await haste_upload(fmt)))
+            await ctx.send((await haste_upload(self.bot.web, fmt)))
         else:
             await ctx.send(fmt)
 
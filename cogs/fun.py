@@ -24,6 +24,12 @@ class Fun:
 
     def __init__(self, bot):
         self.bot = bot
+        self.boing_listener = bot.router.register(
+            self.handle_boing, channel_id=417369794883354625
+        )
+
+    def __unload(self):
+        self.bot.router.unregister(self.boing_listener)
 
     @staticmethod
     async def __error(ctx, error):
@@ -169,7 +175,7 @@ class Fun:
 
         if len(message) > 600:
             key = await gist_upload(
-                {'encoding': {'content': message}}
+                self.bot.web, {'encoding': {'content': message}}
             )
 
             await ctx.send(key)
@@ -177,11 +183,10 @@ class Fun:
             await ctx.send(f'```{message}```')
 
     @staticmethod
-    async def on_message(message):
-        if message.channel.id == 417369794883354625:
-            # noinspection SpellCheckingInspection
-            if 'boing' not in message.content.lower():
-                await message.delete()
+    async def handle_boing(message):
+        # noinspection SpellCheckingInspection
+        if 'boing' not in message.content.lower():
+            await message.delete()
 
 
 def setup(bot):
@@ -1,5 +1,6 @@
+import asyncio
+
 import discord
-import requests
 from discord.ext import commands
 
 import config
@@ -45,11 +46,21 @@ query {
             'Accept': 'application/json'
         }
 
-        r = requests.post(
-            'https://api.github.com/graphql',
-            headers=headers,
-            json={'query': graphql_query}
-        )
+        try:
+            r = await self.bot.web.post(
+                'https://api.github.com/graphql',
+                headers=headers,
+                json={'query': graphql_query},
+                connect_timeout=5,
+                read_timeout=10,
+                # the same query every time, and repos don't come and go much
+                cache=10 * 60,
+                service='github'
+            )
+        except asyncio.TimeoutError:
+            return await ctx.send('GitHub took too long to respond. '
+                                  'Try again later?')
+
         repos = ['/perryprog/tor-genius']
         repos.extend([
             item['node']['resourcePath']
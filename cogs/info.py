@@ -5,10 +5,9 @@ from datetime import datetime
 
 import discord
 import humanize
-from PIL import Image, ImageDraw
 from discord.ext import commands
 
-from cogs.utils import db
+from cogs.utils import db, memes
 from cogs.utils.paginator import Pages
 
 # following is from
@@ -178,23 +177,12 @@ class Info:
 
         # == Drawing ==
 
-        # Each square is 256 by 256
-        width = 256 * len(colors)
-
-        # background is same color as start to be lazy
-        image = Image.new('RGB', (width, 256), colors[0])
-        draw = ImageDraw.Draw(image)
-
-        for i in range(1, len(colors)):
-            draw.rectangle((256 * i, 0, 256 * (i + 1), 256), colors[i])
+        data = await self.bot.renderer.run(memes.color_swatch, colors)
 
         # == Sending ==
-        bio = io.BytesIO()
-        image.save(bio, 'PNG')
-        bio.seek(0)
         await ctx.send(
             file=discord.File(
-                bio,
+                io.BytesIO(data),
                 filename='color.png' if len(colors) == 1 else 'colors.png'
             )
         )
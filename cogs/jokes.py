@@ -1,8 +1,19 @@
+import logging
 import random
+import time
 
-import aiohttp
 from discord.ext import commands
 
+from cogs.utils.config import Config
+from cogs.utils.index import WordIndex
+
+log = logging.getLogger(__name__)
+
+GIT_JOKES_URL = ('https://raw.githubusercontent.com/'
+                 'EugeneKay/git-jokes/lulz/Jokes.txt')
+# how long before we ask GitHub if the jokes changed, in seconds
+GIT_JOKES_MAX_AGE = 24 * 60 * 60
+
 # noinspection SpellCheckingInspection
 opf_list = [
     "Sent from AOL Mobile Mail",
@@ -30,80 +41,127 @@ class Jokes:
     def __init__(self, bot):
         self.bot = bot
 
+        # the last copy of Jokes.txt we got, so restarts don't need GitHub
+        self.git_cache = Config('git_jokes.json')
+        self.git_jokes_index = None
+        self.git_jokes_checked = None
+        self.git_jokes_refresh = None
+
+        corpus = self.git_cache.get('corpus')
+        if corpus is not None:
+            self.git_jokes_index = WordIndex(corpus['jokes'])
+
+    async def refresh_git_jokes(self):
+        """Fetch Jokes.txt if it changed since we last got it."""
+        corpus = self.git_cache.get('corpus')
+        headers = {}
+        if corpus is not None and self.git_jokes_index is not None:
+            if corpus.get('etag'):
+                headers['If-None-Match'] = corpus['etag']
+            if corpus.get('last_modified'):
+                headers['If-Modified-Since'] = corpus['last_modified']
+
+        res = await self.bot.web.get(GIT_JOKES_URL, headers=headers,
+                                    service='github')
+        if res.status == 200:
+            jokes = res.text().splitlines()
+            self.git_jokes_index = WordIndex(jokes)
+            await self.git_cache.put('corpus', {
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified'),
+                'jokes': jokes
+            })
+        elif res.status != 304:
+            log.warning(f'Got a {res.status} fetching git jokes')
+
+        self.git_jokes_checked = time.monotonic()
+
+    async def _revalidate_git_jokes(self):
+        try:
+            await self.refresh_git_jokes()
+        except Exception:
+            log.exception('Failed to revalidate git jokes')
+
+    async def get_git_jokes(self):
+        """The joke index, fetching it if we've never had it and checking for
+        a new version in the background if ours is old."""
+        if self.git_jokes_index is None:
+            await self.refresh_git_jokes()
+        elif self.git_jokes_checked is None or \
+                time.monotonic() - self.git_jokes_checked > GIT_JOKES_MAX_AGE:
+            if self.git_jokes_refresh is None or self.git_jokes_refresh.done():
+                self.git_jokes_refresh = self.bot.loop.create_task(
+                    self._revalidate_git_jokes()
+                )
+        return self.git_jokes_index
+
     @commands.command(aliases=['git', 'gjoke', 'gitjoke'])
     async def git_jokes(self, ctx, query=None):
         """Get a random joke about git"""
-        await ctx.channel.trigger_typing()
-        async with aiohttp.ClientSession() as s:
-            async with s.get('https://raw.githubusercontent.com/EugeneKay/'
-                             'git-jokes/lulz/Jokes.txt') as res:
-                content = await res.text()
-                jokes = content.splitlines()
-                if not query:
-                    return await ctx.send(random.choice(jokes))
-                try:
-                    return await ctx.send(jokes[int(query) - 1])
-                except (IndexError, ValueError):
-                    # shuffle in case it's a short search so you don't
-                    # always get the same results
-                    random.shuffle(jokes)
-                    result = None
-                    for joke in jokes:
-                        if query.lower() in joke.lower():
-                            result = joke
-
-                    if result is None:
-                        return await ctx.send('No results found.')
-                    else:
-                        await ctx.send(result)
+        index = await self.get_git_jokes()
+        if not index:
+            return await ctx.send("Couldn't get any git jokes right now. "
+                                  "Sorry!")
+
+        jokes = index.items
+        if not query:
+            return await ctx.send(random.choice(jokes))
+        try:
+            return await ctx.send(jokes[int(query) - 1])
+        except (IndexError, ValueError):
+            results = index.search(query)
+            if not results:
+                # not a whole word, so fall back to a plain substring search
+                query = query.lower()
+                results = [joke for joke in jokes if query in joke.lower()]
+
+            if not results:
+                return await ctx.send('No results found.')
+            else:
+                await ctx.send(random.choice(results))
 
     @commands.command(aliases=['djoke', 'dad', 'dadjoke'])
     async def dad_jokes(self, ctx):
         """Get a random dad joke"""
         await ctx.channel.trigger_typing()
-        async with aiohttp.ClientSession() as s:
-            async with s.get(
-                    'https://icanhazdadjoke.com/',
-                    headers={'Accept': 'text/plain'}
-            ) as res:
-                joke = await res.text()
-                await ctx.send(joke)
+        res = await self.bot.web.get(
+            'https://icanhazdadjoke.com/',
+            headers={'Accept': 'text/plain'},
+            service='icanhazdadjoke'
+        )
+        await ctx.send(res.text())
 
     @commands.command(aliases=['cnorris', 'chuck', 'cjoke'])
     async def chuck_norris_jokes(self, ctx, query=None):
         """Get a random chuck norris joke, with an optional search"""
         await ctx.channel.trigger_typing()
-        async with aiohttp.ClientSession() as s:
-            if not query:
-                async with s.get(
-                        'https://api.chucknorris.io/jokes/random'
-                ) as res:
-                    joke = await res.json()
-                    await ctx.send(joke['value'])
+        if not query:
+            res = await self.bot.web.get(
+                'https://api.chucknorris.io/jokes/random',
+                service='chucknorris'
+            )
+            await ctx.send(res.json()['value'])
 
-            else:
-                async with s.get(
-                        'https://api.chucknorris.io/jokes/search',
-                        params={'query': query}
-                ) as res:
-                    jokes = await res.json()
-                    jokes = jokes['result']
-                    if not jokes:
-                        return await ctx.send('No results found')
-                    response = [j['value'] for j in jokes][:5]
-                    await ctx.send('\n\n'.join(response))
+        else:
+            res = await self.bot.web.get(
+                'https://api.chucknorris.io/jokes/search',
+                params={'query': query},
+                cache=60 * 60,
+                service='chucknorris'
+            )
+            jokes = res.json()['result']
+            if not jokes:
+                return await ctx.send('No results found')
+            response = [j['value'] for j in jokes][:5]
+            await ctx.send('\n\n'.join(response))
 
     @commands.command(aliases=['yo', 'mamma', 'mom'])
     async def yo_mamma(self, ctx):
         """Yo mom jokes"""
         await ctx.channel.trigger_typing()
-        async with aiohttp.ClientSession() as s:
-            async with s.get(
-                    'http://api.yomomma.info'
-            ) as res:
-                text = await res.json(content_type='text/html')
-                text = text['joke']
-                await ctx.send(text)
+        res = await self.bot.web.get('http://api.yomomma.info',
+                                     service='yomomma')
+        await ctx.send(res.json()['joke'])
 
     @commands.command(aliases=['opf'])
     async def oldpeoplefacebook(self, ctx, query: str.lower = ''):
@@ -36,6 +36,16 @@ class Meta:
         self.bot.help_fallback = bot.get_command('help') if not value else value
         bot.remove_command('help')
 
+        # the user id is checked in the callback since we might not be logged
+        # in yet
+        self.reset_listener = bot.router.register(
+            self.handle_prefix_reset,
+            pattern=r'<@!?([0-9]+)> prefix (reset|clear)'
+        )
+
+    def __unload(self):
+        self.bot.router.unregister(self.reset_listener)
+
     @staticmethod
     async def __error(ctx, error):
         if isinstance(error, commands.BadArgument):
@@ -161,16 +171,11 @@ class Meta:
                            'followed by "prefix reset" (or clear) and the '
                            'prefixes will be reset.')
 
-    async def on_message(self, message):
-
-        # dumb pycharm
-        # noinspection PyUnusedLocal
-        user_id = self.bot.user.id
-        reg = re.match(f'<@!?{user_id}> prefix (reset|clear)', message.content)
-        if reg:
+    async def handle_prefix_reset(self, message, reg):
+        if int(reg.group(1)) == self.bot.user.id:
             if not message.author.permissions_in(message.channel).ban_members:
                 raise commands.CheckFailure()
-            if reg.groups()[0] == 'reset':
+            if reg.group(2) == 'reset':
                 await self.bot.set_guild_prefixes(message.guild, [['-', False]])
             else:
                 await self.bot.set_guild_prefixes(message.guild, [])
@@ -10,7 +10,6 @@ import datetime
 import logging
 import re
 import string
-import time
 from collections import Counter
 
 import discord
@@ -19,6 +18,7 @@ import humanize
 from discord.ext import commands
 
 from cogs.utils.checks import has_permissions
+from cogs.utils.lockdown import SpamDetector
 
 log = logging.getLogger(__name__)
 
@@ -40,6 +40,15 @@ class Mod:
     def __init__(self, bot):
         self.bot = bot
 
+        # thresholds can be tweaked in config.py
+        config = bot.config
+        self.spam = SpamDetector(
+            channel_rate=getattr(config, 'spam_channel_rate', 15),
+            user_rate=getattr(config, 'spam_user_rate', 6),
+            per=getattr(config, 'spam_per', 10.0),
+            max_duration=getattr(config, 'spam_max_lockdown', 60 * 60)
+        )
+
     @staticmethod
     async def __error(ctx, error):
         if isinstance(error, commands.BadArgument):
@@ -135,42 +144,62 @@ class Mod:
     @commands.command()
     @has_permissions(manage_messages=True)
     async def lockdown(self, ctx):
-        channel_ld = self.bot.lockdown.get(ctx.channel, None)
-        if channel_ld:
-            # There is a lockdown on the channel, turn it off
-            del self.bot.lockdown[ctx.channel]
-        else:
-            # turn on lockdown
-            self.bot.lockdown[ctx.channel] = time.time()
+        if not self.bot.lockdown.unlock(ctx.channel.id):
+            # There was no lockdown on the channel, turn it on
+            self.bot.lockdown.lock(ctx.channel.id)
 
         await ctx.auto_react()
 
     async def __global_check(self, ctx):
+        # Most channels aren't on lockdown, so look that up before anything
+        # more expensive
+        channel_ld = self.bot.lockdown.expires_at(ctx.channel.id)
+        if channel_ld is None:
+            # No lockdown active, continue
+            return True
+
         owner = await self.bot.is_owner(ctx.author)
         if owner:
             return True
 
-        if ctx.author.permissions_in(ctx.channel).manage_messages:
+        perms = self.bot.permission_cache.permissions_for(ctx.channel,
+                                                          ctx.author)
+        if perms.manage_messages:
             return True
 
-        channel_ld = self.bot.lockdown.get(ctx.channel, None)
-        if channel_ld:
-            if time.time() - channel_ld > 120:
-                # It's been a minute
-                del self.bot.lockdown[ctx.channel]
-                return True
-
-            time_to_wait = humanize.naturaldelta(
-                datetime.datetime.fromtimestamp(channel_ld + 120)
-            )
-            await ctx.author.send(
-                f'Sorry, but the bot is on lockdown because some people were '
-                f'spamming it. Please wait {time_to_wait}.'
-            )
-            return False
-        else:
-            # No lockdown active, continue
-            return True
+        time_to_wait = humanize.naturaldelta(
+            datetime.datetime.fromtimestamp(channel_ld)
+        )
+        await ctx.author.send(
+            f'Sorry, but the bot is on lockdown because some people were '
+            f'spamming it. Please wait {time_to_wait}.'
+        )
+        return False
+
+    async def on_command(self, ctx):
+        if ctx.guild is None:
+            return
+
+        # people who can ignore lockdowns can't trigger one either
+        perms = self.bot.permission_cache.permissions_for(ctx.channel,
+                                                          ctx.author)
+        if perms.manage_messages:
+            return
+
+        tripped = self.spam.hit(ctx.channel.id, ctx.author.id)
+        if not tripped or ctx.channel.id in self.bot.lockdown:
+            return
+
+        duration = self.spam.strike(ctx.channel.id)
+        self.bot.lockdown.lock(ctx.channel.id, duration)
+        log.warning(f'Automatic lockdown in {ctx.channel} ({ctx.channel.id}) '
+                    f'for {duration}s after {ctx.author} ran '
+                    f'{ctx.command.qualified_name}')
+
+        await ctx.channel.send(
+            f'Too many commands at once, so the bot is on lockdown here for '
+            f'{humanize.naturaldelta(duration)}.'
+        )
 
     @commands.group(aliases=['delete', 'prune'],
                     invoke_without_command=True)
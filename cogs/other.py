@@ -1,20 +1,92 @@
+import asyncio
 import io
+import logging
 import re
-import textwrap
-from math import floor
 
-import aiohttp
 import discord
-from PIL import Image, ImageFont, ImageDraw
 from discord.ext import commands
 
+from cogs.utils import memes
+from cogs.utils.images import FontCache, TemplateStore, decode
 from cogs.utils.paginator import Pages
 
+log = logging.getLogger(__name__)
 
-async def download(url):
-    async with aiohttp.ClientSession() as sess:
-        async with sess.get(url) as r:
-            return io.BytesIO(await r.read())
+# :no_entry: emoji
+BLAME_EMOJI = (
+    'no-entry-sign.png',
+    'https://emojipedia-us.s3.amazonaws.com/thumbs/240/twitter/'
+    '120/no-entry-sign_1f6ab.png'
+)
+
+
+async def download(web, url):
+    r = await web.get(url)
+    if r.status != 200:
+        raise commands.BadArgument(
+            f"Couldn't download that image (HTTP {r.status})"
+        )
+    return r.body
+
+
+async def download_image(ctx, url):
+    data = await download(ctx.bot.web, url)
+    return await ctx.bot.renderer.run(decode, data)
+
+
+async def member_avatar(ctx, member, url=None):
+    """A member's avatar, from the avatar cache if we've seen it before.
+
+    ``url`` overrides where it's downloaded from. The image is shared, so
+    don't draw on it."""
+    key = (member.id, member.avatar if url is None else 'custom')
+
+    img = ctx.bot.avatars.get(key)
+    if img is None:
+        # everyone asking for the same avatar at once shares one load
+        img = await ctx.bot.avatars.flights.do(
+            key, _load_avatar, ctx, member, key, url
+        )
+    return img
+
+
+async def _load_avatar(ctx, member, key, url):
+    cache = ctx.bot.avatars
+
+    img = await ctx.bot.renderer.run(cache.load, key)
+    if img is None:
+        if url is None:
+            url = member.avatar_url_as(format='png')
+            url = url.replace('gif', 'png').strip('<>')
+        data = await download(ctx.bot.web, url)
+        img = await ctx.bot.renderer.run(cache.store, key, data)
+    cache.put(key, img)
+
+    return img
+
+
+async def static_asset(ctx, name, url, size):
+    """A static image resized to ``size``. It's only ever downloaded once,
+    and kept under assets/ after that. Don't draw on it."""
+    assets = ctx.bot.assets
+    renderer = ctx.bot.renderer
+
+    img = assets.get(name, size)
+    if img is not None:
+        return img
+
+    if assets.get(name) is None:
+        original = await renderer.run(assets.load, name)
+        if original is None:
+            data = await download(ctx.bot.web, url)
+            original = await renderer.run(assets.store, name, data)
+        assets.put(name, original)
+
+    return await renderer.run(assets.resized, name, size)
+
+
+def png_file(data, filename):
+    return discord.File(io.BytesIO(data), filename=filename)
 
 
 class AvatarOrOnlineImage(commands.Converter):
@@ -22,33 +94,23 @@ class AvatarOrOnlineImage(commands.Converter):
         try:
             possible_member = await commands.MemberConverter() \
                 .convert(ctx, argument)
-            url = possible_member.avatar_url_as(format='png')
-            url = url.replace('gif', 'png').strip('<>')
-
-            img = await download(url)
-
-            img = Image.open(img)
-
-            return img.convert('RGBA')
         except commands.BadArgument:
             pass
+        else:
+            return await member_avatar(ctx, possible_member)
 
-            # from https://stackoverflow.com/questions/169625/
-            # regex-to-check-if-valid-url-that-ends-in-jpg-png-or-gif
-            # (Sorry about breaking the URL)
+        # from https://stackoverflow.com/questions/169625/
+        # regex-to-check-if-valid-url-that-ends-in-jpg-png-or-gif
+        # (Sorry about breaking the URL)
 
-            # will add more image formats as time goes on
+        # will add more image formats as time goes on
         regex = r'<?(?:([^:/?#]+):)?(?://([^/?#]*))?([^?#]*\.' \
                 r'(?:jpg|png|jpeg))(?:\?([^#]*))?(?:#(.*))?>?'
 
         regex = re.compile(regex, re.IGNORECASE)
 
         if re.fullmatch(regex, argument):
-            img = await download(argument.strip('<>'))
-
-            img = Image.open(img)
-
-            return img.convert('RGBA')
+            return await download_image(ctx, argument.strip('<>'))
         else:
             # must be text
             return argument
@@ -60,36 +122,31 @@ class AvatarOrOnlineImageOrText(commands.Converter):
         try:
             possible_member = await commands.MemberConverter() \
                 .convert(ctx, argument)
-            url = possible_member.avatar_url_as(format='png')
-            url = url.replace('gif', 'png').strip('<>')
-
-            img = await download(url)
-
-            img = Image.open(img)
-
-            return img.convert('RGBA'), possible_member.name
         except commands.BadArgument:
             pass
+        else:
+            img = await member_avatar(ctx, possible_member)
+
+            return img, possible_member.name
 
-            # from https://stackoverflow.com/questions/169625/
-            # regex-to-check-if-valid-url-that-ends-in-jpg-png-or-gif
-            # (Sorry about breaking the URL)
+        # from https://stackoverflow.com/questions/169625/
+        # regex-to-check-if-valid-url-that-ends-in-jpg-png-or-gif
+        # (Sorry about breaking the URL)
 
-            # will add more image formats as time goes on
+        # will add more image formats as time goes on
         regex = r'<?(?:([^:/?#]+):)?(?://([^/?#]*))?([^?#]*\.' \
                 r'(?:jpg|png|jpeg))(?:\?([^#]*))?(?:#(.*))?>?'
 
         regex = re.compile(regex, re.IGNORECASE)
 
         if re.fullmatch(regex, argument.split(' ')[0]):
-            img = await download(argument.split(' ')[0].strip('<>'))
-
-            img = Image.open(img)
+            img = await download_image(ctx,
+                                       argument.split(' ')[0].strip('<>'))
 
             text = ' '.join(argument.split(' ')[1:])
             if not text:
                 raise commands.BadArgument('No text supplied for image')
-            return img.convert('RGBA'), text
+            return img, text
         else:
             raise commands.BadArgument(
                 "That URL doesn't seem to lead to a valid image"
@@ -105,19 +162,15 @@ class LinkOrAvatar(commands.Converter):
         try:
             possible_member = await commands.MemberConverter() \
                 .convert(ctx, argument)
-            if possible_member.name not in self.special_cases:
-                url = possible_member.avatar_url_as(format='png')
-                url = url.replace('gif', 'png').strip('<>')
-            else:
-                url = self.special_cases[possible_member.name]
-
-            img = await download(url)
-
-            img = Image.open(img)
-
-            return img.convert('RGBA'), possible_member.name
         except commands.BadArgument:
             pass
+        else:
+            img = await member_avatar(
+                ctx, possible_member,
+                self.special_cases.get(possible_member.name)
+            )
+
+            return img, possible_member.name
 
         # from https://stackoverflow.com/questions/169625/
         # regex-to-check-if-valid-url-that-ends-in-jpg-png-or-gif
@@ -130,14 +183,13 @@ class LinkOrAvatar(commands.Converter):
         regex = re.compile(regex, re.IGNORECASE)
 
         if re.fullmatch(regex, argument.split(' ')[0]):
-            img = await download(argument.split(' ')[0].strip('<>'))
-
-            img = Image.open(img)
+            img = await download_image(ctx,
+                                       argument.split(' ')[0].strip('<>'))
 
             text = ' '.join(argument.split(' ')[1:])
             if not text:
                 raise commands.BadArgument('No text supplied for image')
-            return img.convert('RGBA'), text
+            return img, text
         else:
             raise commands.BadArgument(
                 "That URL doesn't seem to lead to a valid image"
@@ -149,55 +201,78 @@ class Other:
     def __init__(self, bot):
         self.bot = bot
 
+        self.templates = TemplateStore('memes')
+        self.bot.metrics.add_gauge('templates', self.templates.stats)
+
+        self.fonts = FontCache()
+        try:
+            self.fonts.preload(memes.FONT)
+        except OSError:
+            log.warning(f"Couldn't preload {memes.FONT}, "
+                        f"meme commands won't work")
+        self.bot.metrics.add_gauge('fonts', self.fonts.stats)
+        self.bot.metrics.add_gauge('avatars', bot.avatars.stats)
+        self.bot.metrics.add_gauge('assets', bot.assets.stats)
+
+    def __unload(self):
+        self.bot.metrics.remove_gauge('templates')
+        self.bot.metrics.remove_gauge('fonts')
+        self.bot.metrics.remove_gauge('avatars')
+        self.bot.metrics.remove_gauge('assets')
+
     @staticmethod
     async def __error(ctx, err):
         if isinstance(err, commands.BadArgument):
             await ctx.send(err)
+        elif isinstance(err, commands.CommandInvokeError) and \
+                isinstance(err.original, asyncio.TimeoutError):
+            await ctx.send('That took too long to draw. Try a smaller image?')
 
     @commands.command()
     async def forum(self, ctx, *, search):
         """Search the Swift Discourse Forum for anything."""
-        with aiohttp.ClientSession() as s:
-            async with s.get(
-                    'https://forums.swift.org/search/query.json',
-                    params={'term': search}
-            ) as r:
-                r = await r.json()
+        r = await self.bot.web.get(
+            'https://forums.swift.org/search/query.json',
+            params={'term': search},
+            cache=5 * 60,
+            service='swift_forums'
+        )
+        r = r.json()
 
-                if r['grouped_search_result'] is None:
-                    return await ctx.send('No results found.')
+        if r['grouped_search_result'] is None:
+            return await ctx.send('No results found.')
 
-                data = []
+        data = []
 
-                # I'm sorry. (Ok not as bad now)
+        # I'm sorry. (Ok not as bad now)
 
-                # idk why, but topics seems to disappear sometimes
-                data.extend([(f't/{t["id"]}', t['title'])
-                             for t in r.get('topics', [])])
+        # idk why, but topics seems to disappear sometimes
+        data.extend([(f't/{t["id"]}', t['title'])
+                     for t in r.get('topics', [])])
 
-                data.extend([(f'u/{u["username"]}',
-                              f'{u["username"]} ({u["name"]})')
-                             for u in r['users']])
+        data.extend([(f'u/{u["username"]}',
+                      f'{u["username"]} ({u["name"]})')
+                     for u in r['users']])
 
-                data.extend([(f'c/{c.id}', c['name'])
-                             for c in r['categories']])
+        data.extend([(f'c/{c.id}', c['name'])
+                     for c in r['categories']])
 
-                data.extend([(f'tags/{t["name"]}', t['name'])
-                             for t in r['tags']])
+        data.extend([(f'tags/{t["name"]}', t['name'])
+                     for t in r['tags']])
 
-                data.extend([(f'p/{p["id"]}', p['blurb'])
-                             for p in r['posts']])
+        data.extend([(f'p/{p["id"]}', p['blurb'])
+                     for p in r['posts']])
 
-                if not data:
-                    return await ctx.send('No results found.')
+        if not data:
+            return await ctx.send('No results found.')
 
-                p = Pages(
-                    ctx,
-                    entries=[f'[{d[1]}](https://forums.swift.org/{d[0]})'
-                             for d in data]
-                )
+        p = Pages(
+            ctx,
+            entries=[f'[{d[1]}](https://forums.swift.org/{d[0]})'
+                     for d in data]
+        )
 
-                await p.paginate()
+        await p.paginate()
 
     # noinspection PyUnresolvedReferences,PyPep8Naming
     @commands.command()
@@ -214,65 +289,19 @@ class Other:
             'itsthejoker': 'joker'
         }
 
-        # :no_entry: emoji
-        emoji = 'https://emojipedia-us.s3.amazonaws.com/thumbs/240/twitter/' \
-                '120/no-entry-sign_1f6ab.png'
-        emoji = await download(emoji)
-        emoji = Image.open(emoji)
-        emoji = emoji.convert('RGBA')
-
-        # make the image 3 times larger than the avatar
-        large_image = Image.new('RGBA', [3 * x for x in img.size], (0,) * 4)
-        lW, lH = large_image.size
-        W, H = img.size
-        # the center box for the avatar
-        box = (W, H, W * 2, H * 2)
-
-        # make the emoji 20% bigger than the avatar
-        emoji = emoji.resize([floor(x * 1.2) for x in img.size])
-        eW, eH = emoji.size
-
-        large_image.paste(img.copy(), box)
-        large_image.paste(
-            emoji,
-
-            (  # center the emoji
-                floor((lW - eW) / 2),
-
-                floor((lH - eH) / 2)
-            ),
-
-            emoji
+        emoji = await static_asset(
+            ctx, *BLAME_EMOJI, memes.blame_emoji_size(img)
         )
 
-        # make the font size relative to the avatar size
-        fnt = ImageFont.truetype('Arial.ttf', floor(img.size[0] / 4))
-        d = ImageDraw.Draw(large_image)
-
         name = special_cases.get(
             name,
             re.sub(r'\W', '', name).lower()
         )
 
-        message = f'#blame{name}'
-        tW, tH = d.textsize(message, fnt)
-
-        d.text(
-            (  # center the text
-                floor((lW - tW) / 2),
-                # make the text somewhat centered (a bit offset so it
-                # looks good) in the first "row"
-                floor(H / 2) - floor(W / 4)
-            ),
-            message,
-            font=fnt,
-            fill=(255,) * 4
+        data = await self.bot.renderer.run(
+            memes.blame, self.fonts, img, emoji, f'#blame{name}'
         )
-
-        bio = io.BytesIO()
-        large_image.save(bio, 'PNG')
-        bio.seek(0)
-        await ctx.send(file=discord.File(bio, filename='blame.png'))
+        await ctx.send(file=png_file(data, 'blame.png'))
 
     # noinspection PyPep8Naming,PyUnresolvedReferences
     @commands.command(aliases=['floor'])
@@ -284,30 +313,10 @@ class Other:
         if len(what) > 179:
             return await ctx.send("The floor isn't that long. (max 179 chars)")
 
-        meme_format = Image.open('memes/floor.png')
-
-        # == Text ==
-        fnt = ImageFont.truetype('Arial.ttf', 30)
-        d = ImageDraw.Draw(meme_format)
-
-        margin = 20
-        offset = 25
-        for line in textwrap.wrap(f'The floor is {what}', width=65):
-            d.text((margin, offset), line, font=fnt, fill=(0,) * 3)
-            offset += fnt.getsize(line)[1]
-
-        # == Avatars ==
-        first = img.resize((20, 20))
-        second = img.resize((40, 40))
-
-        meme_format.paste(first, (143, 135))
-        meme_format.paste(second, (465, 133))
-
-        # == Sending ==
-        bio = io.BytesIO()
-        meme_format.save(bio, 'PNG')
-        bio.seek(0)
-        await ctx.send(file=discord.File(bio, filename='floor.png'))
+        data = await self.bot.renderer.run(
+            memes.the_floor, self.templates, self.fonts, img, what
+        )
+        await ctx.send(file=png_file(data, 'floor.png'))
 
     # noinspection PyUnresolvedReferences
     @commands.command(aliases=['car'])
@@ -320,34 +329,11 @@ class Other:
         if len(first_option) > 54 or len(second_option) > 54:
             return await ctx.send("Your options can't be that long. (Max 54)")
 
-        meme_format = Image.open('memes/highway.jpg')
-
-        # == Text one ==
-        fnt = ImageFont.truetype('Arial.ttf', 22)
-        d = ImageDraw.Draw(meme_format)
-
-        margin = 165
-        offset = 80
-        for line in textwrap.wrap(first_option, width=9):
-            d.text((margin, offset), line, font=fnt, fill=(255,) * 3)
-            offset += fnt.getsize(line)[1]
-
-        # == Text two ==
-
-        margin = 380
-        offset = 80
-        for line in textwrap.wrap(second_option, width=9):
-            d.text((margin, offset), line, font=fnt, fill=(255,) * 3)
-            offset += fnt.getsize(line)[1]
-
-        # == Image ==
-        meme_format.paste(img.resize((50, 50)), (340, 430))
-
-        # == Sending ==
-        bio = io.BytesIO()
-        meme_format.save(bio, 'PNG')
-        bio.seek(0)
-        await ctx.send(file=discord.File(bio, filename='floor.png'))
+        data = await self.bot.renderer.run(
+            memes.highway, self.templates, self.fonts, img,
+            first_option, second_option
+        )
+        await ctx.send(file=png_file(data, 'floor.png'))
 
     @commands.command()
     async def wheeze(self, ctx, *, message: str):
@@ -358,19 +344,10 @@ class Other:
                 "Can't do more than 10 characters because reasons"
             )
 
-        meme_format = Image.open('memes/wheeze.png')
-
-        # == Text ==
-        fnt = ImageFont.truetype('Arial.ttf', 20)
-        d = ImageDraw.Draw(meme_format)
-
-        d.text((34, 483), message, font=fnt, fill=(0,) * 3)
-
-        # == Sending ==
-        bio = io.BytesIO()
-        meme_format.save(bio, 'PNG')
-        bio.seek(0)
-        await ctx.send(file=discord.File(bio, filename='wheeze.png'))
+        data = await self.bot.renderer.run(
+            memes.wheeze, self.templates, self.fonts, message
+        )
+        await ctx.send(file=png_file(data, 'wheeze.png'))
 
     # noinspection PyUnresolvedReferences
     @commands.command(aliases=['garbage'])
@@ -390,44 +367,10 @@ class Other:
                     "Can't do more than 6 characters because reasons"
                 )
 
-        meme_format = Image.open('memes/garbage.jpg')
-        meme_format = meme_format.convert('RGBA')
-
-        # == Text/Avatars 1==
-        if isinstance(first, str):
-            fnt = ImageFont.truetype('Arial.ttf', 50)
-            d = ImageDraw.Draw(meme_format)
-
-            margin = 440
-            offset = 35
-            for line in textwrap.wrap(first, width=4):
-                d.text((margin, offset), line, font=fnt, fill=(255,) * 3)
-                offset += fnt.getsize(line)[1]
-        else:
-            first = first.resize((180, 180))
-            first = first.rotate(20, expand=True)
-            meme_format.paste(first, (390, 15), first)
-
-        # == Text/Avatars 2 ==
-        if isinstance(second, str):
-            fnt = ImageFont.truetype('Arial.ttf', 50)
-            d = ImageDraw.Draw(meme_format)
-
-            margin = 720
-            offset = 170
-            for line in textwrap.wrap(second, width=5):
-                d.text((margin, offset), line, font=fnt, fill=(0,) * 3)
-                offset += fnt.getsize(line)[1]
-        else:
-            second = second.resize((250, 250))
-            second = second.rotate(-10, expand=True)
-            meme_format.paste(second, (620, 150), second)
-
-        # == Sending ==
-        bio = io.BytesIO()
-        meme_format.save(bio, 'PNG')
-        bio.seek(0)
-        await ctx.send(file=discord.File(bio, filename='floor.png'))
+        data = await self.bot.renderer.run(
+            memes.trash, self.templates, self.fonts, first, second
+        )
+        await ctx.send(file=png_file(data, 'floor.png'))
 
     @commands.command()
     async def captcha(self, ctx, img: AvatarOrOnlineImageOrText,
@@ -438,26 +381,10 @@ class Other:
         name = re.sub(r'\W', '', name).lower()
         name = message or name
 
-        meme_format = Image.open('memes/captcha.png')
-
-        # == Images ==
-        img = img.resize((129, 129))
-
-        for x_mul in range(3):
-            for y_mul in range(3):
-                meme_format.paste(img, (27 + 129 * x_mul, 173 + 129 * y_mul))
-
-        # == Text ==
-        fnt = ImageFont.truetype('Arial.ttf', 30)
-        d = ImageDraw.Draw(meme_format)
-
-        d.text((51, 90), name, font=fnt, fill=(255,) * 3)
-
-        # == Sending ==
-        bio = io.BytesIO()
-        meme_format.save(bio, 'PNG')
-        bio.seek(0)
-        await ctx.send(file=discord.File(bio, filename='floor.png'))
+        data = await self.bot.renderer.run(
+            memes.captcha, self.templates, self.fonts, img, name
+        )
+        await ctx.send(file=png_file(data, 'floor.png'))
 
     @commands.command('spam')
     async def who_did_this(self, ctx, search=3):
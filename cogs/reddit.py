@@ -1,5 +1,9 @@
+import asyncio
+import logging
+import math
 import random
 import re
+import time
 
 import discord
 from discord.ext import commands
@@ -7,8 +11,30 @@ from discord.ext.commands import IDConverter, BadArgument
 from prawcore.exceptions import NotFound
 
 from cogs.utils import db
+from cogs.utils.cache import MISSING, SingleFlight, TTLCache
+from cogs.utils.index import NGramIndex
 from cogs.utils.checks import is_mod, tor_only
 from cogs.utils.paginator import Pages
+from cogs.utils.reddit import FlairIndex, Post
+
+log = logging.getLogger(__name__)
+
+# how often the flair index is brought up to date, in seconds
+FLAIR_POLL_INTERVAL = 2 * 60
+# the poller stops once flair_count hasn't been used for this long, so an
+# idle bot doesn't spend requests on it, in seconds
+FLAIR_IDLE_AFTER = 30 * 60
+# flair_count asks reddit itself if the index is older than this, in seconds
+FLAIR_STALE_AFTER = 3 * FLAIR_POLL_INTERVAL
+# how many of the newest posts each poll lists. Reddit pages are 100 long.
+FLAIR_POLL_LIMIT = 100
+# the only flairs that still change, so the only ones polls recheck
+ACTIVE_FLAIRS = ('Unclaimed', 'In Progress')
+# how long the gamma refresher sleeps between passes over every linked
+# account, in seconds. See Reddit.gamma_ttl for how long counts live.
+GAMMA_REFRESH_INTERVAL = 30 * 60
+# wiki pages barely ever get added, in seconds
+WIKI_REFRESH_INTERVAL = 6 * 60 * 60
 
 
 class RedditConfig(db.Table, table_name='reddit_config'):
@@ -80,19 +106,233 @@ class RedditAccountConverter(IDConverter):
             return reddit_member
 
 
+# These all block, so they only ever run on bot.reddit_worker, which passes
+# each one its thread's own Reddit client.
+
+def tor(reddit):
+    return reddit.subreddit('transcribersofreddit')
+
+
+def wiki_pages(reddit):
+    return [page.name for page in tor(reddit).wiki]
+
+
+def check_redditor(reddit, username):
+    """Raises NotFound if there's no such user."""
+    try:
+        _ = reddit.redditor(username).fullname
+    except AttributeError:
+        # seems to happen when a user has no activity, like /u/asdf.
+        pass
+
+
+def new_posts(reddit, limit):
+    """The newest ``limit`` submissions on ToR, newest first."""
+    return [
+        Post(s.fullname, s.title, s.permalink, s.link_flair_text)
+        for s in tor(reddit).new(limit=limit)
+    ]
+
+
+def listing_calls(count):
+    return math.ceil(count / 100)
+
+
+def current_flairs(reddit, fullnames):
+    # info() asks for 100 at a time, which beats re-listing everything
+    return {s.fullname: s.link_flair_text for s in reddit.info(fullnames)}
+
+
+def latest_tor_flair(reddit, cancelled, username):
+    for comment in reddit.redditor(username).comments.new(limit=None):
+        if cancelled.is_set():
+            return None
+        if comment.subreddit == 'TranscribersOfReddit':
+            return comment.author_flair_text
+    return None
+
+
+def gamma_count(flair):
+    """The number at the start of a flair like '120 Γ', or ``None``."""
+    try:
+        return int(flair.split(' ')[0])
+    except (AttributeError, ValueError):
+        return None
+
+
 class Reddit:
     def __init__(self, bot):
         self.bot = bot
 
+        self.flair_index = FlairIndex(size=500)
+        # when flair_count was last used, see FLAIR_IDLE_AFTER
+        self.flair_used_at = None
+        self.bot.metrics.add_gauge('flair_index', self.flair_index.stats)
+        self.flair_task = bot.loop.create_task(self.poll_flairs())
+
+        # lowercased reddit username: ToR flair text (or None)
+        self.gamma_cache = TTLCache(max_size=4096)
+        # how long the last pass over every linked account took, in seconds
+        self.gamma_pass_seconds = 0.0
+        self.bot.metrics.add_gauge('gammas', self.gamma_cache.stats)
+        self.gamma_task = bot.loop.create_task(self.refresh_gammas())
+
+        self.wiki_index = None
+        self.wiki_flights = SingleFlight(loop=bot.loop)
+        self.wiki_task = bot.loop.create_task(self.refresh_wiki())
+
+    def __unload(self):
+        self.flair_task.cancel()
+        self.gamma_task.cancel()
+        self.wiki_task.cancel()
+        self.bot.metrics.remove_gauge('flair_index')
+        self.bot.metrics.remove_gauge('gammas')
+
+    async def refresh_flair_index(self):
+        index = self.flair_index
+        worker = self.bot.reddit_worker
+
+        # No 'before' cursor: if the post it points at gets removed reddit
+        # just returns nothing forever. List the newest page and let add()
+        # dedupe, like PRAW's streams do.
+        if index.posts:
+            posts = await worker.run(new_posts, FLAIR_POLL_LIMIT, timeout=60,
+                                     background=True)
+            index.api_calls_spent += listing_calls(FLAIR_POLL_LIMIT)
+
+            if any(p.fullname in index.posts for p in posts):
+                # the listing already has current flairs for its own posts
+                listed = {p.fullname for p in posts}
+                active = [
+                    name for flair in ACTIVE_FLAIRS
+                    for name in index.by_flair.get(flair, ())
+                    if name not in listed
+                ]
+                if active:
+                    flairs = await worker.run(current_flairs, active,
+                                              timeout=60, background=True)
+                    index.api_calls_spent += listing_calls(len(active))
+                    index.update_flairs(flairs, active)
+                index.add(posts)
+                index.mark_updated()
+                return
+
+            # more than a page of new posts since the last poll, so there's
+            # a gap
+
+        posts = await worker.run(new_posts, index.size, timeout=60,
+                                 background=True)
+        index.api_calls_spent += listing_calls(index.size)
+        index.reset(posts)
+        index.mark_updated()
+
+    @property
+    def flair_index_in_use(self):
+        return self.flair_used_at is not None and \
+            time.monotonic() - self.flair_used_at < FLAIR_IDLE_AFTER
+
+    async def poll_flairs(self):
+        await self.bot.wait_until_ready()
+
+        while not self.bot.is_closed():
+            try:
+                if self.flair_index_in_use:
+                    await self.refresh_flair_index()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('Failed to refresh the flair index')
+            await asyncio.sleep(FLAIR_POLL_INTERVAL)
+
+    @property
+    def gamma_ttl(self):
+        """How long a gamma count lives.
+
+        Passes are sequential and the sleep only starts once one ends, so a
+        count can go a whole pass plus the interval before it's recounted.
+        Twice that means one failed pass doesn't empty the cache."""
+        return 2 * (GAMMA_REFRESH_INTERVAL + self.gamma_pass_seconds)
+
+    async def fetch_gamma_flair(self, username, background=False):
+        """Walk someone's comments for their ToR flair and cache it."""
+        flair = await self.bot.reddit_worker.run_cancellable(
+            latest_tor_flair, username, timeout=60,
+            expected=(NotFound,), background=background
+        )
+        self.gamma_cache.put(username.lower(), flair, ttl=self.gamma_ttl)
+        return flair
+
+    async def refresh_gammas(self):
+        await self.bot.wait_until_ready()
+
+        while not self.bot.is_closed():
+            query = 'SELECT DISTINCT reddit_username FROM reddit_config;'
+            try:
+                usernames = [r[0] for r in await self.bot.pool.fetch(query)]
+            except Exception:
+                log.exception('Failed to look up linked reddit accounts')
+                usernames = []
+
+            # one at a time, this is background work and can take its time
+            start = time.monotonic()
+            counted = []
+            for username in usernames:
+                try:
+                    await self.fetch_gamma_flair(username, background=True)
+                    counted.append(username)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception(f'Failed to count gammas for /u/{username}')
+
+            # Counts from early in a long pass would otherwise be closer to
+            # expiring than the TTL says, so restart every clock from now.
+            # Failed ones are left alone so a stale count still expires.
+            self.gamma_pass_seconds = time.monotonic() - start
+            for username in counted:
+                self.gamma_cache.touch(username.lower(), self.gamma_ttl)
+
+            await asyncio.sleep(GAMMA_REFRESH_INTERVAL)
+
+    async def fetch_wiki_index(self, background=False):
+        return await self.wiki_flights.do(
+            'wiki', self._fetch_wiki_index, background
+        )
+
+    async def _fetch_wiki_index(self, background):
+        pages = await self.bot.reddit_worker.run(
+            wiki_pages, timeout=15, background=background
+        )
+        self.wiki_index = NGramIndex(pages)
+        return self.wiki_index
+
+    async def refresh_wiki(self):
+        await self.bot.wait_until_ready()
+
+        while not self.bot.is_closed():
+            try:
+                await self.fetch_wiki_index(background=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('Failed to refresh the wiki page list')
+            await asyncio.sleep(WIKI_REFRESH_INTERVAL)
+
     @staticmethod
     async def __error(ctx, error):
         if isinstance(error, BadArgument):
             await ctx.send(error)
+        elif isinstance(error, commands.CommandInvokeError) and \
+                isinstance(error.original, asyncio.TimeoutError):
+            await ctx.send('Reddit is taking too long to respond right now. '
+                           'Try again in a bit!')
 
     @commands.command(name='rwiki')
     async def reddit_wiki_page(self, ctx, *, search: str = None):
-        """Search the wiki pages on r/ToR for something."""
-        sub = ctx.r.subreddit('transcribersofreddit')
+        """Search the wiki pages on r/ToR for something.
+
+        If nothing has your search in its name, you'll get the closest
+        matches instead."""
         if not search:
             embed = discord.Embed(
                 color=ctx.author.color,
@@ -103,16 +343,16 @@ class Reddit:
             await ctx.send(embed=embed)
             return
 
-        results = []
+        index = self.wiki_index or await self.fetch_wiki_index()
+        names = index.search(search) or index.fuzzy(search)
 
-        for page in sub.wiki:
-            if search in str(page.name):
-                results.append(
-                    f'[{page.name}](https://www.reddit.com'
-                    f'/r/TranscribersOfReddit/wiki/{page.name})'
-                )
+        results = [
+            f'[{name}](https://www.reddit.com'
+            f'/r/TranscribersOfReddit/wiki/{name})'
+            for name in names
+        ]
 
-        if results is not []:
+        if results:
             p = Pages(ctx, entries=results)
             p.embed.color = ctx.author.color
             await p.paginate()
@@ -130,12 +370,11 @@ class Reddit:
         elif username.startswith('u/'):
             username = username.replace('u/', '', 1)
 
-        # throw away the value, this is just so we can tell if the user is valid
         try:
-            _ = ctx.r.redditor(username).fullname
-        except AttributeError:
-            # seems to happen when a user has no activity, like /u/asdf.
-            pass
+            await self.bot.reddit_worker.run(
+                check_redditor, username, timeout=10,
+                expected=(NotFound,)
+            )
         except NotFound:
             await ctx.send("Sorry! That username doesn't appear to be valid.")
             return
@@ -284,27 +523,39 @@ FROM reddit_config;
         """Get the number of posts left on r/ToR with a certain flair.
 
         It's by default 'Unclaimed'."""
-        sub = ctx.r.subreddit('transcribersofreddit')
-
-        links = []
-
-        for submission in sub.new(limit=500):
-            if submission.link_flair_text == flair:
-                links.append(submission)
+        self.flair_used_at = time.monotonic()
+
+        index = self.flair_index
+        if index.ready and index.age() < FLAIR_STALE_AFTER:
+            links = index.get(flair)
+            # what listing the newest 500 would have cost
+            index.api_calls_avoided += listing_calls(index.size)
+            note = f' (as of {int(index.age())}s ago)'
+        else:
+            # nothing polled lately, so go ask reddit. That listing is all
+            # the index needs to start from, and the poller takes over.
+            await ctx.channel.trigger_typing()
+            posts = await self.bot.reddit_worker.run(
+                new_posts, index.size, timeout=30
+            )
+            index.reset(posts)
+            index.mark_updated()
+            links = index.get(flair)
+            note = ''
 
         word = 'post' if len(links) == 1 else 'posts'
 
         await ctx.send(
-            f'{len(links)} {flair} {word}!'
+            f'{len(links)} {flair} {word}!{note}'
         )
 
         if len(links) == 0:
             return
 
         p = Pages(ctx, entries=tuple(
-            f'[{s.title.split(" | ")[2][1:-1]}]'
-            f'(https://reddit.com{s.permalink})'
-            for s in links
+            f'[{p.title.split(" | ")[2][1:-1]}]'
+            f'(https://reddit.com{p.permalink})'
+            for p in links
         ))
 
         await p.paginate()
@@ -314,18 +565,72 @@ FROM reddit_config;
         """Get the number of gammas from a user"""
         user = user or await RedditMember.create(ctx, ctx.author)
 
-        r_user = ctx.r.redditor(user.reddit)
-
-        for comment in r_user.comments.new(limit=None):
-            if comment.subreddit == 'TranscribersOfReddit':
-                # re formatting: I'm sorry
-                await ctx.send(embed=discord.Embed(
-                    description=
-                    f'[/u/{user.reddit}](https://reddit.com/u/{user.reddit}) '
-                    f'has {comment.author_flair_text.split(" ")[0]} '
-                    f'transcriptions! '
-                ))
-                return
+        flair = self.gamma_cache.get(user.reddit.lower(), MISSING)
+        if flair is MISSING:
+            await ctx.channel.trigger_typing()
+            flair = await self.fetch_gamma_flair(user.reddit)
+
+        if flair is not None:
+            # re formatting: I'm sorry
+            await ctx.send(embed=discord.Embed(
+                description=
+                f'[/u/{user.reddit}](https://reddit.com/u/{user.reddit}) '
+                f'has {flair.split(" ")[0]} '
+                f'transcriptions! '
+            ))
+
+    @gammas.command(name='top')
+    async def gammas_top(self, ctx):
+        """Everyone with a linked account, ranked by gammas.
+
+        Counts are refreshed in the background, so new links can take a
+        while to show up."""
+        query = """
+SELECT
+  user_id,
+  reddit_username
+FROM reddit_config;
+        """
+
+        ranked = []
+        pending = 0
+        for user_id, username in await ctx.db.fetch(query):
+            flair = self.gamma_cache.get(username.lower(), MISSING)
+            if flair is MISSING:
+                pending += 1
+                continue
+
+            # counted, but no ToR comments or no number in their flair
+            count = gamma_count(flair)
+            if count is None:
+                continue
+
+            user = self.bot.get_user(user_id)
+            name = user.mention if user else f'/u/{username}'
+            ranked.append((count, name, username))
+
+        if not ranked:
+            if pending:
+                await ctx.send("I haven't counted anyone's gammas yet. "
+                               "Try again in a bit!")
+            else:
+                await ctx.send('Nobody linked has any gammas yet.')
+            return
+
+        ranked.sort(key=lambda r: r[0], reverse=True)
+
+        p = Pages(ctx, entries=tuple(
+            f'{name} ([/u/{username}](https://reddit.com/u/{username})): '
+            f'{count}'
+            for count, name, username in ranked
+        ))
+        p.embed.color = ctx.author.color
+
+        if pending:
+            word = 'account hasn\'t' if pending == 1 else 'accounts haven\'t'
+            await ctx.send(f'{pending} linked {word} been counted yet.')
+
+        await p.paginate()
 
 
 def setup(bot):
@@ -1,6 +1,5 @@
 import itertools
 
-import aiohttp
 import discord
 import wolframalpha
 from discord.ext import commands
@@ -8,6 +7,7 @@ from texttable import Texttable, ArraySizeError
 
 import config
 from cogs.admin import haste_upload
+from cogs.utils.cache import MISSING, SingleFlight, TTLCache, normalise
 from cogs.utils.paginator import EmbedPages
 
 
@@ -17,9 +17,50 @@ def code_block(string, lang=''):
     return f'```{lang}\n{string}\n```'
 
 
+def wolfram_pods(client, query):
+    """Run a full query and pull out the plaintext and images.
+
+    This blocks, so it gets run in an executor. Returns ``None`` when there
+    weren't any results.
+    """
+    res = client.query(query)
+
+    data = []
+    images = []
+    try:
+        for pod in res.pods:
+            sub_data = []
+            for sub in pod.subpods:
+                if sub.plaintext:
+                    sub_data.append(sub.plaintext)
+                if hasattr(sub, 'img'):
+                    images.append(sub['img']['@src'])
+                    # sub_data.append(sub['img']['@alt'])
+            data.append(sub_data)
+    except AttributeError:
+        return None
+
+    return data, images
+
+
 class Search:
     def __init__(self, bot):
         self.bot = bot
+        self.wolfram_client = wolframalpha.Client(config.wolfram)
+
+        # Results for popular queries (unit conversions and stuff) don't
+        # change much, and each one costs API quota
+        self.wolfram_cache = TTLCache(max_size=256, ttl=60 * 60)
+        self.quick_cache = TTLCache(max_size=1024, ttl=60 * 60)
+        self.wolfram_flights = SingleFlight(loop=bot.loop)
+
+    async def fetch_wolfram(self, key, query):
+        result = await self.bot.services['wolfram'].call(
+            self.bot.loop.run_in_executor,
+            None, wolfram_pods, self.wolfram_client, query
+        )
+        self.wolfram_cache.put(key, result)
+        return result
 
     @staticmethod
     async def __error(ctx, err):
@@ -32,25 +73,19 @@ class Search:
         """Do a full wolframalpha query, with a very verbose response."""
         await ctx.channel.trigger_typing()
 
-        client = wolframalpha.Client(config.wolfram)
-        res = client.query(query)
+        key = normalise(query)
+        result = self.wolfram_cache.get(key, MISSING)
+        if result is MISSING:
+            result = await self.wolfram_flights.do(
+                key, self.fetch_wolfram, key, query
+            )
 
-        t = Texttable()
-        data = []
-        images = []
-        try:
-            for pod in res.pods:
-                sub_data = []
-                for sub in pod.subpods:
-                    if sub.plaintext:
-                        sub_data.append(sub.plaintext)
-                    if hasattr(sub, 'img'):
-                        images.append(sub['img']['@src'])
-                        # sub_data.append(sub['img']['@alt'])
-                data.append(sub_data)
-        except AttributeError:
+        if result is None:
             return await ctx.send('No results found.')
 
+        data, images = result
+        t = Texttable()
+
         embed_images = [
             discord.Embed().set_image(url=image) for image in images
         ]
@@ -67,7 +102,9 @@ class Search:
                 try:
                     await ctx.send(to_send)
                 except discord.HTTPException:
-                    key = await haste_upload(to_send + '\n' + '\n'.join(images))
+                    key = await haste_upload(
+                        self.bot.web, to_send + '\n' + '\n'.join(images)
+                    )
                     await ctx.send(f'https://hastebin.com/{key}')
             if embed_images:
                 p = EmbedPages(ctx, embeds=embed_images)
@@ -77,7 +114,7 @@ class Search:
         try:
             await ctx.send(code_block(t.draw()))
         except discord.HTTPException:
-            key = await haste_upload(code_block(t.draw()))
+            key = await haste_upload(self.bot.web, code_block(t.draw()))
             await ctx.send(f'https://hastebin.com/{key}')
         if embed_images:
             p = EmbedPages(ctx, embeds=embed_images)
@@ -86,92 +123,101 @@ class Search:
     @commands.command()
     async def quick(self, ctx, *, query):
         """Do a quick wolframalpha query, with a short response"""
-        await ctx.channel.trigger_typing()
-        with aiohttp.ClientSession() as s:
-            async with s.get(
-                    'https://api.wolframalpha.com/v2/result',
-                    params={'i': query, 'appid': config.wolfram}
-            ) as res:
-                text = await res.text()
-                await ctx.send(text)
+        key = normalise(query)
+        text = self.quick_cache.get(key)
+        if text is None:
+            await ctx.channel.trigger_typing()
+            res = await self.bot.web.get(
+                'https://api.wolframalpha.com/v2/result',
+                params={'i': query, 'appid': config.wolfram},
+                service='wolfram',
+                # 501 just means there's no short answer for the query
+                failed=lambda r: r.status >= 500 and r.status != 501
+            )
+            text = res.text()
+
+            # don't remember errors
+            if res.status == 200:
+                self.quick_cache.put(key, text)
+
+        await ctx.send(text)
 
     # noinspection SpellCheckingInspection
     @commands.command(aliases=['ddg', 'duck', 'google', 'goog'])
     async def duckduckgo(self, ctx, *, query: str):
         """Search the DuckDuckGo IA API"""
         await ctx.channel.trigger_typing()
-        with aiohttp.ClientSession() as s:
-            async with s.get(
-                    'https://api.duckduckgo.com',
-                    params={'q': query, 't': 'ToR Genius Discord Bot',
-                            'format': 'json', 'no_html': '1'}
-            ) as res:
-                resp_json = await res.json(
-                    content_type='application/x-javascript'
-                )
-                embeds = {}
-
-                if resp_json['AbstractURL'] != '':
-                    embeds[f'Abstract: {resp_json["Heading"]}'
-                           f' ({resp_json["AbstractSource"]})'] = {
-                        'image': resp_json['Image'],
-                        'desc': f'{resp_json.get("AbstractText", "")}\n\n'
-                                f'{resp_json["AbstractURL"]}'
-                    }
-
-                if resp_json['Definition'] != '':
-                    embeds['Definition'] = {
-                        'desc': f'{resp_json["Definition"]}\n'
-                                f'([{resp_json["DefinitionSource"]}]'
-                                f'({resp_json["DefinitionURL"]}))'
-                    }
-
-                if resp_json['RelatedTopics']:
-                    desc = []
-                    for topic in resp_json['RelatedTopics']:
-                        try:
-                            if len('\n'.join(desc)) > 1000:
-                                break
-                            desc.append(
-                                f'[**{topic["Text"]}**]({topic["FirstURL"]})'
-                            )
-                        except KeyError:
-                            # some weird subtopic thing I guess
-                            continue
-
-                    embeds['Related'] = {
-                        'desc': '\n'.join(desc),
-                        'image': resp_json['RelatedTopics'][0]['Icon']['URL']
-                    }
-
-                if resp_json['Results']:
-                    desc = []
-                    for result in resp_json['Results']:
-                        desc.append(
-                            f'[**{result["Text"]}**]({result["FirstURL"]})'
-                        )
-                    embeds['Top Results'] = {
-                        'desc': '\n'.join(desc),
-                        'image': resp_json['Results'][0]['Icon']['URL']
-                    }
-
-                final_embeds = []
-
-                for embed_title, embed_content in embeds.items():
-                    final_embeds.append(
-                        discord.Embed(
-                            title=embed_title,
-                            description=embed_content['desc'],
-                            color=ctx.author.color
-                        ).set_image(
-                            url=embed_content['image']
-                        ).set_thumbnail(
-                            url='https://i.imgur.com/CVogaGL.png'
-                        )
+        res = await self.bot.web.get(
+            'https://api.duckduckgo.com',
+            params={'q': query, 't': 'ToR Genius Discord Bot',
+                    'format': 'json', 'no_html': '1'},
+            cache=60 * 60,
+            service='duckduckgo'
+        )
+        resp_json = res.json()
+        embeds = {}
+
+        if resp_json['AbstractURL'] != '':
+            embeds[f'Abstract: {resp_json["Heading"]}'
+                   f' ({resp_json["AbstractSource"]})'] = {
+                'image': resp_json['Image'],
+                'desc': f'{resp_json.get("AbstractText", "")}\n\n'
+                        f'{resp_json["AbstractURL"]}'
+            }
+
+        if resp_json['Definition'] != '':
+            embeds['Definition'] = {
+                'desc': f'{resp_json["Definition"]}\n'
+                        f'([{resp_json["DefinitionSource"]}]'
+                        f'({resp_json["DefinitionURL"]}))'
+            }
+
+        if resp_json['RelatedTopics']:
+            desc = []
+            for topic in resp_json['RelatedTopics']:
+                try:
+                    if len('\n'.join(desc)) > 1000:
+                        break
+                    desc.append(
+                        f'[**{topic["Text"]}**]({topic["FirstURL"]})'
                     )
+                except KeyError:
+                    # some weird subtopic thing I guess
+                    continue
+
+            embeds['Related'] = {
+                'desc': '\n'.join(desc),
+                'image': resp_json['RelatedTopics'][0]['Icon']['URL']
+            }
+
+        if resp_json['Results']:
+            desc = []
+            for result in resp_json['Results']:
+                desc.append(
+                    f'[**{result["Text"]}**]({result["FirstURL"]})'
+                )
+            embeds['Top Results'] = {
+                'desc': '\n'.join(desc),
+                'image': resp_json['Results'][0]['Icon']['URL']
+            }
+
+        final_embeds = []
+
+        for embed_title, embed_content in embeds.items():
+            final_embeds.append(
+                discord.Embed(
+                    title=embed_title,
+                    description=embed_content['desc'],
+                    color=ctx.author.color
+                ).set_image(
+                    url=embed_content['image']
+                ).set_thumbnail(
+                    url='https://i.imgur.com/CVogaGL.png'
+                )
+            )
 
-                p = EmbedPages(ctx, embeds=final_embeds)
-                await p.paginate()
+        p = EmbedPages(ctx, embeds=final_embeds)
+        await p.paginate()
 
 
 def setup(bot):
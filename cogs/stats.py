@@ -0,0 +1,131 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+import asyncio
+import os
+import uuid
+
+from discord.ext import commands
+from texttable import Texttable
+
+from cogs.admin import haste_upload
+from cogs.utils import stats
+
+# how often the plaintext metrics file gets rewritten, in seconds
+DUMP_INTERVAL = 15
+
+
+def ms(seconds):
+    return f'{seconds * 1000:.2f}ms'
+
+
+def write_atomic(name, text):
+    # same idea as Config._dump, so a scraper never sees half a file
+    temp = f'{uuid.uuid4()}{name}.tmp'
+    with open(temp, 'w') as f:
+        f.write(text)
+
+    os.replace(temp, name)
+
+
+class Stats:
+    """Where the time goes"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.bot.metrics.add_gauge('pool', lambda: dict(bot.pool_stats))
+        self.bot.metrics.add_gauge('permissions', bot.permission_cache.stats)
+        self.bot.metrics.add_gauge(
+            'lockdown', lambda: {'active': len(bot.lockdown)}
+        )
+        self.bot.metrics.add_gauge('http', bot.web.stats)
+        self.bot.metrics.add_gauge('breaker', bot.services.stats)
+        self.bot.metrics.add_gauge('render', bot.renderer.stats)
+        self.dump_task = bot.loop.create_task(self.dump_metrics())
+
+    def __unload(self):
+        self.dump_task.cancel()
+        self.bot.metrics.remove_gauge('pool')
+        self.bot.metrics.remove_gauge('permissions')
+        self.bot.metrics.remove_gauge('lockdown')
+        self.bot.metrics.remove_gauge('http')
+        self.bot.metrics.remove_gauge('breaker')
+        self.bot.metrics.remove_gauge('render')
+
+    @staticmethod
+    async def __local_check(ctx):
+        return await ctx.bot.is_owner(ctx.author)
+
+    async def dump_metrics(self):
+        await self.bot.wait_until_ready()
+        name = getattr(self.bot.config, 'metrics_file', 'metrics.txt')
+
+        while not self.bot.is_closed():
+            await self.bot.loop.run_in_executor(
+                None, write_atomic, name, self.bot.metrics.to_text()
+            )
+            await asyncio.sleep(DUMP_INTERVAL)
+
+    @staticmethod
+    async def send_table(ctx, rows, extra=''):
+        table = Texttable()
+        table.set_cols_dtype(['t'] * len(rows[0]))
+        table.add_rows(rows)
+
+        fmt = f'```\n{table.draw()}\n{extra}```'
+        if len(fmt) > 2000:
+            await ctx.send(await haste_upload(ctx.bot.web, fmt))
+        else:
+            await ctx.send(fmt)
+
+    @commands.group(invoke_without_command=True, hidden=True)
+    async def stats(self, ctx, *, command: str = None):
+        """Latency percentiles for every command, or each phase of one."""
+        metrics = self.bot.metrics
+
+        if command is None:
+            rows = [['Command', 'Count', 'p50', 'p95', 'p99']]
+            by_count = sorted(
+                metrics.commands.items(),
+                key=lambda i: i[1]['total'].count,
+                reverse=True
+            )
+            for name, histograms in by_count:
+                total = histograms['total']
+                rows.append([name, total.count] + [
+                    ms(total.percentile(p)) for p in (50, 95, 99)
+                ])
+
+            extra = '\n'.join(
+                f'{k}: {v}' for k, v in metrics.read_gauges().items()
+            )
+            return await self.send_table(ctx, rows, extra + '\n')
+
+        histograms = metrics.commands.get(command)
+        if histograms is None:
+            return await ctx.send('No stats for that command yet.')
+
+        rows = [['Phase', 'Count', 'p50', 'p95', 'p99']]
+        for phase in stats.PHASES:
+            h = histograms[phase]
+            rows.append([phase, h.count] + [
+                ms(h.percentile(p)) for p in (50, 95, 99)
+            ])
+
+        await self.send_table(ctx, rows)
+
+    @stats.command(name='dump')
+    async def stats_dump(self, ctx):
+        """Upload the plaintext metrics dump."""
+        await ctx.send(
+            await haste_upload(self.bot.web, self.bot.metrics.to_text())
+        )
+
+
+def setup(bot):
+    bot.add_cog(Stats(bot))
+    stats.instrument()
+
+
+def teardown(_):
+    stats.uninstrument()
@@ -1,9 +1,7 @@
 #!/usr/bin/env python3
-import json
-from urllib import parse
+import asyncio
 
 import discord
-import requests
 from discord.ext import commands
 
 
@@ -20,10 +18,14 @@ class Dictionary:
         number = 1
         if " | " in msg:
             msg, number = msg.rsplit(" | ", 1)
-        search = parse.quote(msg)
-        response = requests.get(
-            "http://api.urbandictionary.com/v0/define?term={}".format(search)).text
-        result = json.loads(response)
+        try:
+            response = await ctx.bot.web.get(
+                "http://api.urbandictionary.com/v0/define", params={"term": msg},
+                connect_timeout=5, read_timeout=10, cache=60 * 60,
+                service="urban")
+        except asyncio.TimeoutError:
+            return await ctx.send("Urban Dictionary took too long to respond. Try again later?")
+        result = response.json()
         if result["result_type"] == "no_results":
             await ctx.send("{} couldn't be found on Urban Dictionary.".format(msg))
         else:
@@ -0,0 +1,289 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# Offline replay of messages through get_context and process_commands. Nothing
+# here talks to Discord: guilds, channels and members are fakes and every HTTP
+# call is swallowed by FakeHTTP.
+import asyncio
+import itertools
+import json
+import random
+import time
+import tracemalloc
+
+import discord
+from PIL import Image
+
+OWNER_ID = 1
+BOT_ID = 2
+
+# (weight, content) for generated streams. Most messages in a busy guild
+# aren't commands, so neither are most of these.
+SYNTHETIC = (
+    (70, 'just some chatter about transcribing'),
+    (10, 'lol'),
+    (5, '-ping'),
+    (5, '-choose tea coffee "hot chocolate"'),
+    (4, '-shuffle a b c d e f'),
+    (3, '-b bench marks'),
+    (3, '-notacommand with args'),
+)
+
+
+class FakeHTTP:
+    """Accepts any HTTP call and returns a plausible payload"""
+
+    def __init__(self):
+        self.calls = 0
+        self._ids = itertools.count(10 ** 17)
+
+    def __getattr__(self, name):
+        async def request(*args, **_):
+            self.calls += 1
+            # send_message(channel_id, content, ...) is the one we care about
+            content = next((a for a in args if isinstance(a, str)), None)
+            return {'id': next(self._ids), 'content': content}
+
+        return request
+
+
+class FakeState:
+    def __init__(self, bot):
+        self.http = bot.http
+
+    def create_message(self, *, channel, data):
+        return FakeMessage(self, data['id'], data.get('content') or '',
+                           channel, channel.guild, None)
+
+
+class FakeUser:
+    bot = False
+    discriminator = '0000'
+    avatar = None
+
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f'<@{user_id}>'
+        self.roles = []
+
+    def __str__(self):
+        return f'{self.name}#{self.discriminator}'
+
+    def avatar_url_as(self, **_):
+        return f'https://cdn.discordapp.com/embed/avatars/{self.id % 5}.png'
+
+
+class FakeMember(FakeUser):
+    def __init__(self, user_id, name, guild):
+        super().__init__(user_id, name)
+        self.guild = guild
+        self.guild_permissions = discord.Permissions.none()
+        self.color = discord.Color.default()
+
+    def permissions_in(self, channel):
+        return channel.permissions_for(self)
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f'guild-{guild_id}'
+        self.members = {}
+        self.me = self.member(BOT_ID)
+
+    def member(self, user_id):
+        try:
+            return self.members[user_id]
+        except KeyError:
+            m = self.members[user_id] = FakeMember(user_id, f'user{user_id}',
+                                                   self)
+            return m
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_member_named(self, name):
+        return discord.utils.get(self.members.values(), name=name)
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.name = f'channel-{channel_id}'
+
+    def permissions_for(self, member):
+        if member.id == BOT_ID:
+            return discord.Permissions.all()
+        return discord.Permissions.none()
+
+    async def trigger_typing(self):
+        pass
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self, state, message_id, content, channel, guild, author):
+        self._state = state
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+        self.guild = guild
+        self.author = author
+        self.embeds = []
+        self.attachments = []
+        self.mentions = []
+        self.raw_mentions = []
+        self.created_at = None
+
+    async def edit(self, *, content=None, **_):
+        if content is not None:
+            self.content = content
+
+    async def delete(self):
+        pass
+
+    async def add_reaction(self, _):
+        pass
+
+
+class Replay:
+    """Builds fake messages from JSONL records and feeds them to a bot.
+
+    A record looks like ``{"content": "-ping", "guild_id": 1,
+    "channel_id": 10, "author_id": 100}``. Only ``content`` is required.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.state = FakeState(bot)
+        self.guilds = {}
+        self.channels = {}
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def prepare(cls, bot):
+        """Make a freshly constructed bot usable without logging in"""
+        bot.http = FakeHTTP()
+        # noinspection PyProtectedMember
+        bot._connection.user = FakeUser(BOT_ID, 'ToR Genius')
+        bot.owner_id = OWNER_ID
+        return cls(bot)
+
+    def message(self, record):
+        guild_id = record.get('guild_id', 1)
+        guild = self.guilds.get(guild_id) or self.guilds.setdefault(
+            guild_id, FakeGuild(guild_id)
+        )
+
+        channel_id = record.get('channel_id', 10)
+        channel = self.channels.get(channel_id) or self.channels.setdefault(
+            channel_id, FakeChannel(channel_id, guild)
+        )
+
+        author = guild.member(record.get('author_id', 100))
+        author.bot = record.get('bot', False)
+
+        return FakeMessage(self.state, next(self._ids), record['content'],
+                           channel, guild, author)
+
+    async def run(self, records, *, allocations=False):
+        messages = [self.message(r) for r in records]
+        latencies = []
+
+        if allocations:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        for message in messages:
+            before = time.perf_counter()
+            await self.bot.process_commands(message)
+            latencies.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - start
+
+        result = {
+            'messages': len(messages),
+            'seconds': elapsed,
+            'per_second': len(messages) / elapsed if elapsed else 0.0,
+            'latencies': sorted(latencies),
+            'http_calls': self.bot.http.calls
+        }
+
+        if allocations:
+            result['current'], result['peak'] = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return result
+
+
+def load_records(fp):
+    return [json.loads(line) for line in fp if line.strip()]
+
+
+def synthetic_records(count, *, seed=None, guilds=3, channels=5, authors=50):
+    rng = random.Random(seed)
+    weights, contents = zip(*SYNTHETIC)
+
+    return [
+        {
+            'content': content,
+            'guild_id': rng.randrange(guilds) + 1,
+            'channel_id': rng.randrange(channels) + 10,
+            'author_id': rng.randrange(authors) + 100
+        }
+        for content in rng.choices(contents, weights, k=count)
+    ]
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def synthetic_avatar(size):
+    # noise, so PNG encoding has as much work to do as a real photo
+    return Image.effect_noise((size, size), 64).convert('RGBA')
+
+
+async def render_load(job, count, concurrency, *, renderer=None):
+    """Run ``job`` ``count`` times, ``concurrency`` at a time, either right
+    on the loop or on ``renderer``. Also measures how late a 1ms timer fires
+    meanwhile, which is how long everything else on the loop would wait."""
+    loop = asyncio.get_event_loop()
+    stalls = []
+
+    async def ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - start - 0.001)
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            if renderer is None:
+                job()
+            else:
+                await renderer.run(job)
+            await asyncio.sleep(0)
+
+    tick = loop.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    seconds = time.perf_counter() - start
+    tick.cancel()
+
+    stalls.sort()
+    return {
+        'jobs': count,
+        'seconds': seconds,
+        'per_second': count / seconds,
+        'stalls': stalls
+    }
@@ -0,0 +1,146 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+import asyncio
+import time
+from collections import OrderedDict
+
+# for when None is a perfectly good cached value
+MISSING = object()
+
+
+def normalise(query):
+    """Collapse whitespace so trivially different queries share a cache
+    entry. Case is kept, Wolfram|Alpha reads "mg" and "Mg" differently."""
+    return ' '.join(query.split())
+
+
+class TTLCache:
+    """A dict-ish LRU cache where entries also expire after ``ttl`` seconds.
+
+    Parameters
+    -----------
+    max_size: int
+        How many entries to keep before evicting the least recently used.
+    ttl: float
+        How long an entry is good for, in seconds.
+    """
+
+    def __init__(self, max_size=256, ttl=60 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def touch(self, key, ttl=None):
+        """Make ``key`` expire ``ttl`` seconds from now, if it's still
+        cached. Doesn't count as a hit or make it recently used."""
+        try:
+            _, value = self._data[key]
+        except KeyError:
+            return
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+
+    def pop(self, key, default=None):
+        try:
+            return self._data.pop(key)[1]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits,
+                'misses': self.misses}
+
+
+class SingleFlight:
+    """Lets concurrent calls with the same key share one in-flight call.
+
+    The first caller for a key starts the work as its own task. Anyone who
+    asks for the same key before it finishes waits on that task instead of
+    starting another, and gets the same result or exception. One caller
+    giving up doesn't cancel the work for everyone else, but once nobody is
+    waiting any more, it is cancelled.
+    """
+
+    def __init__(self, *, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.calls = 0
+        self.coalesced = 0
+        # key: [task, number of waiters]
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    def _land(self, key, flight):
+        # a cancelled flight might still be winding down when a new one for
+        # the same key takes off, so only remove our own
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _run(self, key, flight, coro):
+        try:
+            return await coro
+        finally:
+            self._land(key, flight)
+
+    async def do(self, key, func, *args, **kwargs):
+        """Await ``func(*args, **kwargs)``, or the call already running for
+        ``key``."""
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = self._flights[key] = [None, 0]
+            flight[0] = self.loop.create_task(
+                self._run(key, flight, func(*args, **kwargs))
+            )
+            # if every waiter left, nobody else will look at the exception
+            flight[0].add_done_callback(
+                lambda t: t.cancelled() or t.exception()
+            )
+        else:
+            self.coalesced += 1
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                task.cancel()
+                self._land(key, flight)
+
+    def stats(self):
+        return {'inflight': len(self._flights), 'calls': self.calls,
+                'coalesced': self.coalesced}
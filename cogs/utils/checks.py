@@ -9,9 +9,64 @@
 # May tweak it a bit, but I'm hungry and just want to have checks on prefix
 # junk
 
+from collections import Counter, OrderedDict
+
 from discord.ext import commands
 
 
+class PermissionCache:
+    """Remembers resolved permissions so checks and the help paginator don't
+    redo the role and overwrite math for every command.
+
+    Entries are keyed by ``(guild, channel, member, version)``. The version is
+    per guild and gets bumped by the bot whenever roles, channel overwrites
+    or someone's roles change, which makes every old entry for that guild
+    unreachable. Those then fall off the end of the LRU.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.versions = Counter()
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def _get(self, key, resolve):
+        try:
+            perms = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            perms = self._cache[key] = resolve()
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+
+        return perms
+
+    def permissions_for(self, channel, member):
+        guild = getattr(channel, 'guild', None)
+        if guild is None:
+            # DMs, nothing worth caching
+            return channel.permissions_for(member)
+
+        key = (guild.id, channel.id, member.id, self.versions[guild.id])
+        return self._get(key, lambda: channel.permissions_for(member))
+
+    def guild_permissions(self, member):
+        guild = member.guild
+        key = (guild.id, None, member.id, self.versions[guild.id])
+        return self._get(key, lambda: member.guild_permissions)
+
+    def invalidate(self, guild):
+        self.versions[guild.id] += 1
+
+    def stats(self):
+        return {'size': len(self._cache), 'hits': self.hits,
+                'misses': self.misses}
+
+
 # Once again, basically mostly stolen from
 # https://github.com/Rapptz/RoboDanny/blob/rewrite/cogs/utils/checks.py
 
@@ -22,14 +77,16 @@ async def check_permissions(ctx, perms, *, check=all, check_self=False,
     if owner and not check_self and not check_both:
         return True
 
+    cache = ctx.bot.permission_cache
+
     if check_both:
-        resolved1 = ctx.channel.permissions_for(ctx.author)
+        resolved1 = cache.permissions_for(ctx.channel, ctx.author)
         resolved1_check = check(
             getattr(resolved1, name, None) == value for name, value in
             perms.items()
         )
 
-        resolved2 = ctx.channel.permissions_for(ctx.guild.me)
+        resolved2 = cache.permissions_for(ctx.channel, ctx.guild.me)
         resolved2_check = check(
             getattr(resolved2, name, None) == value for name, value in
             perms.items()
@@ -37,8 +94,8 @@ async def check_permissions(ctx, perms, *, check=all, check_self=False,
 
         return (resolved1_check or owner) and resolved2_check
 
-    resolved = ctx.channel.permissions_for(
-        ctx.author if not check_self else ctx.guild.me
+    resolved = cache.permissions_for(
+        ctx.channel, ctx.author if not check_self else ctx.guild.me
     )
     return check(
         getattr(resolved, name, None) == value for name, value in perms.items()
@@ -53,14 +110,14 @@ def has_permissions(*, check=all, **perms):
 
 
 async def check_guild_permissions(ctx, perms, *, check=all):
-    is_owner = await ctx.bot.is_owner(ctx.author)
-    if is_owner:
+    owner = await ctx.bot.is_owner(ctx.author)
+    if owner:
         return True
 
     if ctx.guild is None:
         return False
 
-    resolved = ctx.author.guild_permissions
+    resolved = ctx.bot.permission_cache.guild_permissions(ctx.author)
     return check(
         getattr(resolved, name, None) == value for name, value in perms.items()
     )
@@ -3,9 +3,9 @@
 #
 # Licensed under the MIT License. https://opensource.org/licenses/MIT
 import asyncio
-from collections import namedtuple
+import time
+from collections import Counter, namedtuple
 
-import praw
 from discord.ext import commands
 
 
@@ -21,18 +21,52 @@ class _ContextDBAcquire:
         return self.ctx._acquire(self.timeout).__await__()
 
     async def __aenter__(self):
-        await self.ctx._acquire(self.timeout)
-        return self.ctx.db
+        return await self.ctx._acquire(self.timeout)
 
     async def __aexit__(self, *args):
         await self.ctx.release()
 
 
+# anything slower than this counts as having waited on the pool
+POOL_WAIT_THRESHOLD = 0.005
+
+
+# noinspection PyProtectedMember
+class _LazyConnection:
+    """Stand-in for ``ctx.db`` that only checks out a pool connection when a
+    query is actually run.
+
+    Any attribute is forwarded to the real connection, so
+    ``await ctx.db.fetchval(...)`` and friends work as before. The connection
+    stays checked out until ``ctx.release()``, which the bot calls after the
+    command finishes.
+    """
+    __slots__ = ('ctx',)
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def __getattr__(self, name):
+        async def method(*args, **kwargs):
+            con = await self.ctx._acquire(None)
+            return await getattr(con, name)(*args, **kwargs)
+
+        method.__name__ = name
+        return method
+
+    def __repr__(self):
+        return f'<_LazyConnection acquired={self.ctx._db is not None}>'
+
+
 class Context(commands.Context):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.pool = self.bot.pool
-        self.db = None
+        self._db = None
+        self.db = _LazyConnection(self)
+
+        # seconds spent in each phase, see cogs.utils.stats
+        self.timings = Counter()
         self.token = 'A dead meme'
         self.emojis = namedtuple(
             'Emojis', 'check xmark white_check cross_mark tick_yes')\
@@ -42,12 +76,23 @@ class Context(commands.Context):
              '\N{CROSS MARK}',
              '<:tickYes:404815005423501313>')
 
-        self.r = praw.Reddit('main', user_agent='ToR Discord Bot')
+    @property
+    def r(self):
+        """The bot's shared Reddit client"""
+        return self.bot.reddit
 
     async def _acquire(self, timeout):
-        if self.db is None:
-            self.db = await self.pool.acquire(timeout=timeout)
-        return self.db
+        if self._db is None:
+            start = time.perf_counter()
+            self._db = await self.pool.acquire(timeout=timeout)
+            waited = time.perf_counter() - start
+
+            stats = self.bot.pool_stats
+            stats['acquired'] += 1
+            stats['wait_seconds'] += waited
+            if waited > POOL_WAIT_THRESHOLD:
+                stats['waited'] += 1
+        return self._db
 
     @property
     def acquire(self):
@@ -57,13 +102,21 @@ class Context(commands.Context):
         """
         Releases the database connection from the pool.
         Useful if needed for "long" interactive commands where
-        we want to release the connection and re-acquire later.
-        Otherwise, this is called automatically by the bot.
+        we want to release the connection. The next query on ``ctx.db``
+        will check out a new one. Otherwise, this is called automatically by
+        the bot.
         """
 
-        if self.db is not None:
-            await self.bot.pool.release(self.db)
-            self.db = None
+        if self._db is not None:
+            await self.bot.pool.release(self._db)
+            self._db = None
+
+    async def send(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().send(*args, **kwargs)
+        finally:
+            self.timings['send'] += time.perf_counter() - start
 
     async def auto_react(self, emoji='👌'):
         # noinspection PyBroadException
@@ -102,8 +155,8 @@ class Context(commands.Context):
         delete_after: bool
             Whether to delete the confirmation message after we're done.
         reacquire: bool
-            Whether to release the database connection and then acquire it
-            again when we're done.
+            Whether to release the database connection while waiting. It's
+            acquired again on the next query.
         author_id: Optional[int]
             The member who should respond to the prompt. Defaults to the author
             of the Context's message.
@@ -172,9 +225,6 @@ class Context(commands.Context):
             confirm = None
 
         try:
-            if reacquire:
-                await self.acquire()
-
             if delete_after:
                 await msg.delete()
         finally:
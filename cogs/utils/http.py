@@ -0,0 +1,321 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# One aiohttp session for the whole bot. Opening a session per request meant a
+# fresh DNS lookup and TCP+TLS handshake every single time.
+import asyncio
+import json
+import time
+from collections import OrderedDict, defaultdict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from cogs.utils.cache import SingleFlight
+from cogs.utils.stats import Histogram
+
+
+class Response:
+    """A fully read response, so nothing has to be used inside a context
+    manager and the connection goes straight back to the pool."""
+    __slots__ = ('status', 'headers', 'body', 'url')
+
+    def __init__(self, status, headers, body, url):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    def text(self, encoding='utf-8'):
+        return self.body.decode(encoding, errors='replace')
+
+    def json(self):
+        # a lot of APIs lie about their content type, so don't check it
+        return json.loads(self.text())
+
+
+# hosts that get their own request stats. Everything else, like images from
+# whatever URL someone gave a meme command, goes under "other" so the metrics
+# don't grow with every new host.
+STATS_HOSTS = frozenset({
+    'api.wolframalpha.com', 'api.duckduckgo.com', 'api.urbandictionary.com',
+    'api.chucknorris.io', 'api.yomomma.info', 'icanhazdadjoke.com',
+    'hastebin.com', 'api.github.com', 'forums.swift.org',
+    'cdn.discordapp.com'
+})
+
+
+def server_error(response):
+    """The default for what counts against a service's circuit breaker."""
+    return response.status >= 500
+
+
+def cache_key(method, url, kwargs):
+    """What makes two requests the same, as far as the cache is concerned."""
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((str(k), freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        return str(value)
+
+    return (method.upper(), url) + tuple(
+        (name, freeze(kwargs[name]))
+        for name in ('params', 'headers', 'json', 'data') if name in kwargs
+    )
+
+
+class ResponseCache:
+    """An LRU of :class:`Response` objects, bounded by total body size.
+
+    Entries go stale after their TTL but are kept around if they have an ETag
+    or Last-Modified header, so they can be revalidated instead of downloaded
+    again.
+
+    Parameters
+    -----------
+    max_bytes: int
+        How many bytes of bodies to keep before evicting the least recently
+        used.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        # key: [expires, Response]
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Returns ``(fresh, response)``. ``response`` is ``None`` if there's
+        nothing usable, and stale if it can be revalidated."""
+        try:
+            expires, response = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return False, None
+
+        self._data.move_to_end(key)
+        if expires > time.monotonic():
+            self.hits += 1
+            return True, response
+
+        self.misses += 1
+        if 'ETag' in response.headers or 'Last-Modified' in response.headers:
+            return False, response
+
+        self.pop(key)
+        return False, None
+
+    def put(self, key, response, ttl):
+        self.pop(key)
+        if len(response.body) > self.max_bytes:
+            return
+
+        self._data[key] = [time.monotonic() + ttl, response]
+        self.size += len(response.body)
+
+        while self.size > self.max_bytes:
+            _, (_, old) = self._data.popitem(last=False)
+            self.size -= len(old.body)
+            self.evictions += 1
+
+    def refresh(self, key, response, ttl):
+        """The server said our copy is still good, so keep it another
+        ``ttl`` seconds. It may have been evicted while we were asking, so
+        it's put back rather than updated in place."""
+        self.put(key, response, ttl)
+        self.revalidated += 1
+
+    def pop(self, key):
+        try:
+            _, response = self._data.pop(key)
+        except KeyError:
+            return None
+        self.size -= len(response.body)
+        return response
+
+    def stats(self):
+        return {'cache_entries': len(self._data), 'cache_bytes': self.size,
+                'cache_hits': self.hits, 'cache_misses': self.misses,
+                'cache_revalidated': self.revalidated,
+                'cache_evictions': self.evictions}
+
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+
+class HTTPClient:
+    """The bot's HTTP client, available as ``bot.web``.
+
+    Parameters
+    -----------
+    limit: int
+        Total number of connections in the pool.
+    limit_per_host: int
+        Connections kept to any single host.
+    dns_ttl: int
+        How long resolved addresses are cached, in seconds.
+    keepalive: float
+        How long idle connections are kept open, in seconds.
+    connect_timeout: float
+        Default time allowed to connect and get the response headers back.
+    read_timeout: float
+        Default time allowed to read the body once the headers are in.
+    cache_bytes: int
+        How big the response cache can get. Nothing is cached unless a
+        request asks for it with ``cache=``.
+    services: :class:`cogs.utils.policy.Services`
+        Policies requests can be made under with ``service=``.
+    """
+
+    def __init__(self, *, loop=None, limit=100, limit_per_host=10,
+                 dns_ttl=300, keepalive=30.0, connect_timeout=10.0,
+                 read_timeout=30.0, cache_bytes=8 * 1024 * 1024,
+                 services=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.services = services
+        self.cache = ResponseCache(max_bytes=cache_bytes)
+        self.flights = SingleFlight(loop=loop)
+
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_ttl,
+            keepalive_timeout=keepalive,
+            loop=loop
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            loop=loop,
+            headers={'User-Agent': 'ToR Genius Discord Bot'}
+        )
+        self.hosts = defaultdict(HostStats)
+
+    async def request(self, method, url, *, service=None, failed=server_error,
+                      cache=None, **kwargs):
+        """Make a request and read the whole body.
+
+        Raises :exc:`asyncio.TimeoutError` if connecting (up to the response
+        headers) or reading the body takes longer than allowed.
+
+        Pass ``cache=<seconds>`` to reuse a successful response to the exact
+        same request for that long. Only do that for requests that don't
+        change anything. Identical cached requests made at the same time
+        also share one round trip.
+
+        Pass ``service=<name>`` to go through that service's rate limit and
+        circuit breaker, which can raise
+        :exc:`cogs.utils.policy.ServiceUnavailable`. A cache hit never
+        touches the service. ``failed`` decides which responses count as the
+        service failing, any 5xx by default.
+        """
+        if service is not None:
+            kwargs['service'] = service
+            kwargs['failed'] = failed
+
+        if cache is None:
+            return await self._send(method, url, **kwargs)
+
+        key = cache_key(method, url, kwargs)
+        fresh, cached = self.cache.get(key)
+        if fresh:
+            return cached
+
+        return await self.flights.do(
+            key, self._cached_request, key, cached, cache, method, url, kwargs
+        )
+
+    async def _cached_request(self, key, cached, ttl, method, url, kwargs):
+
+        if cached is not None:
+            headers = dict(kwargs.get('headers') or {})
+            if 'ETag' in cached.headers:
+                headers['If-None-Match'] = cached.headers['ETag']
+            if 'Last-Modified' in cached.headers:
+                headers['If-Modified-Since'] = cached.headers['Last-Modified']
+            kwargs = dict(kwargs, headers=headers)
+
+        response = await self._send(method, url, **kwargs)
+        if response.status == 304 and cached is not None:
+            self.cache.refresh(key, cached, ttl)
+            return cached
+        if response.status == 200:
+            self.cache.put(key, response, ttl)
+        return response
+
+    async def _send(self, method, url, *, service=None, failed=server_error,
+                    **kwargs):
+        if service is None:
+            return await self._request(method, url, **kwargs)
+        return await self.services[service].call(
+            self._request, method, url, failed=failed, **kwargs
+        )
+
+    async def _request(self, method, url, *, connect_timeout=None,
+                       read_timeout=None, **kwargs):
+        name = urlsplit(url).hostname
+        host = self.hosts[name if name in STATS_HOSTS else 'other']
+        host.requests += 1
+
+        start = time.perf_counter()
+        try:
+            r = await asyncio.wait_for(
+                self.session.request(method, url, **kwargs),
+                connect_timeout or self.connect_timeout
+            )
+            try:
+                body = await asyncio.wait_for(
+                    r.read(), read_timeout or self.read_timeout
+                )
+            finally:
+                r.release()
+
+            return Response(r.status, r.headers, body, str(r.url))
+        except Exception:
+            host.errors += 1
+            raise
+        finally:
+            host.latency.observe(time.perf_counter() - start)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        # close() only became a coroutine in later aiohttp versions
+        ret = self.session.close()
+        if ret is not None:
+            await ret
+
+    def stats(self):
+        result = self.cache.stats()
+        result.update(
+            (f'flights_{k}', v) for k, v in self.flights.stats().items()
+        )
+        for name, host in self.hosts.items():
+            label = f'{{host="{name}"}}'
+            result[f'requests{label}'] = host.requests
+            result[f'errors{label}'] = host.errors
+            for p in (50, 95):
+                result[f'latency_p{p}_seconds{label}'] = round(
+                    host.latency.percentile(p), 4
+                )
+        return result
@@ -0,0 +1,393 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageFont
+
+from cogs.utils.cache import SingleFlight
+from cogs.utils.stats import Histogram
+
+# the sizes the meme templates always use
+FONT_SIZES = (20, 22, 30, 50)
+
+
+def decode(data):
+    """Decode image bytes into an RGBA image."""
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert('RGBA')
+
+
+def to_png(img):
+    bio = io.BytesIO()
+    img.save(bio, 'PNG')
+    return bio.getvalue()
+
+
+class TemplateStore:
+    """Every meme template in a directory, decoded once.
+
+    :meth:`get` hands out copies, so renders can draw on them freely. If a
+    file changes on disk it gets decoded again the next time it's asked for.
+
+    Parameters
+    -----------
+    directory: str
+        Where the templates live.
+    """
+
+    def __init__(self, directory='memes'):
+        self.directory = directory
+        # (file name, mode): (mtime, decoded image)
+        self._templates = {}
+        self.loads = 0
+        # renders on different threads share this
+        self._lock = threading.Lock()
+
+        for name in sorted(os.listdir(directory)):
+            self._load(name)
+
+    def _load(self, name, mode=None):
+        path = os.path.join(self.directory, name)
+        mtime = os.stat(path).st_mtime
+
+        with Image.open(path) as img:
+            img.load()
+            img = img.convert(mode) if mode else img.copy()
+
+        self._templates[name, mode] = (mtime, img)
+        self.loads += 1
+        return mtime, img
+
+    def get(self, name, mode=None):
+        """A copy of template ``name``, converted to ``mode`` if given."""
+        with self._lock:
+            try:
+                mtime, img = self._templates[name, mode]
+            except KeyError:
+                mtime, img = self._load(name, mode)
+            else:
+                path = os.path.join(self.directory, name)
+                if os.stat(path).st_mtime != mtime:
+                    mtime, img = self._load(name, mode)
+
+        # a reload swaps in a new image rather than changing this one, so
+        # copying outside the lock is fine
+        return img.copy()
+
+    def stats(self):
+        return {'templates': len(self._templates), 'loads': self.loads}
+
+
+class FontCache:
+    """Parsed TrueType fonts, keyed by path and size.
+
+    Preloaded fonts are kept forever. Anything else (like blame's font, which
+    is sized to the avatar) is kept in an LRU of ``max_size`` fonts.
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._pinned = {}
+        self._lru = OrderedDict()
+        # renders on different threads share this
+        self._lock = threading.Lock()
+
+    def preload(self, path, sizes=FONT_SIZES):
+        for size in sizes:
+            self._pinned[path, size] = ImageFont.truetype(path, size)
+
+    def get(self, path, size):
+        key = (path, size)
+        font = self._pinned.get(key)
+        if font is not None:
+            self.hits += 1
+            return font
+
+        with self._lock:
+            try:
+                font = self._lru[key]
+            except KeyError:
+                self.misses += 1
+                font = self._lru[key] = ImageFont.truetype(path, size)
+                while len(self._lru) > self.max_size:
+                    self._lru.popitem(last=False)
+            else:
+                self.hits += 1
+                self._lru.move_to_end(key)
+
+        return font
+
+    def stats(self):
+        return {'loaded': len(self._pinned) + len(self._lru),
+                'hits': self.hits, 'misses': self.misses}
+
+
+class Renderer:
+    """Runs image work on a thread pool, available as ``bot.renderer``.
+
+    Pillow lets go of the GIL while decoding, resizing and encoding, so
+    threads get real parallelism here without having to copy every image
+    into another process. The templates, fonts and avatars we've already
+    decoded are shared too.
+
+    Parameters
+    -----------
+    max_workers: int
+        Threads to render on.
+    max_jobs: int
+        Jobs allowed to be running or queued at once, counting ones that
+        timed out but are still on a thread. Anything past that waits its
+        turn on the event loop.
+    timeout: float
+        How long a job gets, including waiting for its turn, in seconds.
+    """
+
+    def __init__(self, *, loop=None, max_workers=2, max_jobs=8, timeout=20.0):
+        self.loop = loop or asyncio.get_event_loop()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='render')
+        self._slots = asyncio.Semaphore(max_jobs)
+        self.jobs = 0
+        self.timeouts = 0
+        self.latency = Histogram()
+
+    async def _run(self, func, args):
+        await self._slots.acquire()
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        # released when the thread finishes, not when we stop waiting
+        future.add_done_callback(
+            lambda _: self.loop.call_soon_threadsafe(self._slots.release)
+        )
+        return await asyncio.wrap_future(future, loop=self.loop)
+
+    async def run(self, func, *args, timeout=None):
+        """Run ``func(*args)`` on the pool and return what it returns.
+
+        Raises :exc:`asyncio.TimeoutError` if it takes too long.
+        """
+        self.jobs += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self._run(func, args),
+                                          timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {'jobs': self.jobs, 'timeouts': self.timeouts,
+                'latency_p50_seconds': round(self.latency.percentile(50), 4),
+                'latency_p95_seconds': round(self.latency.percentile(95), 4)}
+
+
+class AvatarCache:
+    """Avatars, keyed by ``(user id, avatar hash)`` so a new avatar is a new
+    key.
+
+    The PNG bytes are kept on disk and decoded RGBA images are kept in
+    memory, up to ``max_bytes`` of pixels. Images from :meth:`get` are shared
+    between renders, so treat them as read only. Every meme function already
+    does, since resize and rotate return new images.
+
+    :meth:`load` and :meth:`store` touch the disk and decode, so run them on
+    the renderer. Misses should go through :attr:`flights` so everyone after
+    the same avatar shares one load.
+
+    Parameters
+    -----------
+    directory: str
+        Where the PNGs go.
+    max_bytes: int
+        How much decoded pixel data to keep in memory.
+    """
+
+    def __init__(self, directory='cache/avatars', max_bytes=64 * 1024 * 1024,
+                 *, loop=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.flights = SingleFlight(loop=loop)
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # key: decoded image
+        self._images = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _cost(img):
+        return img.width * img.height * len(img.getbands())
+
+    def _path(self, key):
+        user_id, avatar = key
+        return os.path.join(self.directory, f'{user_id}-{avatar}.png')
+
+    def get(self, key):
+        """The decoded image if it's in memory, otherwise ``None``."""
+        img = self._images.get(key)
+        if img is not None:
+            self.hits += 1
+            self._images.move_to_end(key)
+        return img
+
+    def put(self, key, img):
+        old = self._images.pop(key, None)
+        if old is not None:
+            self.size -= self._cost(old)
+
+        cost = self._cost(img)
+        if cost > self.max_bytes:
+            return
+
+        self._images[key] = img
+        self.size += cost
+        while self.size > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self.size -= self._cost(evicted)
+
+    def load(self, key):
+        """Decode the copy on disk, or return ``None`` if there isn't one."""
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        return decode(data)
+
+    def store(self, key, data):
+        """Save freshly downloaded bytes, dropping the user's old avatars,
+        and return them decoded."""
+        img = decode(data)
+
+        path = self._path(key)
+        prefix = f'{key[0]}-'
+        # another thread could be storing the same user right now, so every
+        # write gets its own temp file
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=prefix,
+                                         suffix='.tmp', delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and not name.endswith('.tmp') and \
+                    os.path.join(self.directory, name) != path:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+        return img
+
+    def stats(self):
+        return {'images': len(self._images), 'bytes': self.size,
+                'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'coalesced': self.flights.coalesced}
+
+
+class AssetCache:
+    """Static images we'd otherwise keep downloading, like blame's emoji.
+
+    Each asset is downloaded once into ``directory`` and decoded once. Resized
+    copies are kept in an LRU keyed by name and size. Like avatars, the
+    images are shared, so don't draw on them.
+
+    :meth:`load`, :meth:`store` and :meth:`resized` touch the disk or pixels,
+    so run them on the renderer.
+
+    Parameters
+    -----------
+    directory: str
+        Where the downloaded files go.
+    max_variants: int
+        How many resized copies to keep.
+    """
+
+    def __init__(self, directory='assets', max_variants=64):
+        self.directory = directory
+        self.max_variants = max_variants
+        self.downloads = 0
+        # name: decoded image
+        self._originals = {}
+        # (name, size): resized image
+        self._variants = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, name, size=None):
+        """The image in memory, resized to ``size`` if given, or ``None``."""
+        with self._lock:
+            if size is None:
+                return self._originals.get(name)
+
+            img = self._variants.get((name, size))
+            if img is not None:
+                self._variants.move_to_end((name, size))
+            return img
+
+    def put(self, name, img):
+        with self._lock:
+            self._originals[name] = img
+
+    def load(self, name):
+        """Decode the copy on disk, or return ``None`` if there isn't one."""
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                return decode(f.read())
+        except FileNotFoundError:
+            return None
+
+    def store(self, name, data):
+        """Save a freshly downloaded asset and return it decoded."""
+        img = decode(data)
+
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=name,
+                                         suffix='.tmp', delete=False) as f:
+            f.write(data)
+        os.replace(f.name, os.path.join(self.directory, name))
+
+        self.downloads += 1
+        return img
+
+    def resized(self, name, size):
+        """``name`` resized to ``size``, which must already be loaded."""
+        img = self.get(name, size)
+        if img is not None:
+            return img
+
+        img = self.get(name).resize(size)
+        with self._lock:
+            self._variants[name, size] = img
+            while len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+        return img
+
+    def stats(self):
+        return {'originals': len(self._originals),
+                'variants': len(self._variants),
+                'downloads': self.downloads}
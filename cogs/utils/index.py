@@ -0,0 +1,127 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+import re
+from collections import Counter, defaultdict
+
+
+def ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NGramIndex:
+    """Case insensitive substring and fuzzy search over a fixed list of
+    strings.
+
+    Every string is broken into lowercase n-grams up front, so a search only
+    has to look at strings that share all the query's n-grams instead of
+    checking every single one.
+
+    Parameters
+    -----------
+    items: iterable of str
+        What to search through. Order is kept in the results.
+    n: int
+        The n-gram length. Queries shorter than this fall back to a scan.
+    """
+
+    def __init__(self, items=(), n=3):
+        self.n = n
+        self.items = list(items)
+        self._lowered = [item.lower() for item in self.items]
+        self._grams = [ngrams(item, n) for item in self._lowered]
+
+        # n-gram: {position in items}
+        self._postings = defaultdict(set)
+        for i, grams in enumerate(self._grams):
+            for gram in grams:
+                self._postings[gram].add(i)
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query):
+        """Every item containing ``query``, ignoring case."""
+        query = query.lower()
+        if len(query) < self.n:
+            candidates = range(len(self.items))
+        else:
+            grams = sorted(ngrams(query, self.n),
+                           key=lambda g: len(self._postings.get(g, ())))
+            candidates = set(self._postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self._postings.get(gram, set())
+            candidates = sorted(candidates)
+
+        # sharing every n-gram doesn't mean they're in the right order
+        return [self.items[i] for i in candidates
+                if query in self._lowered[i]]
+
+    def fuzzy(self, query, *, limit=10, cutoff=0.3):
+        """Items that look like ``query``, best first, by how many n-grams
+        they share with it."""
+        grams = ngrams(query.lower(), self.n)
+        if not grams:
+            return []
+
+        shared = Counter()
+        for gram in grams:
+            for i in self._postings.get(gram, ()):
+                shared[i] += 1
+
+        scored = []
+        for i, count in shared.items():
+            # jaccard similarity
+            score = count / len(grams | self._grams[i])
+            if score >= cutoff:
+                scored.append((score, i))
+
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [self.items[i] for _, i in scored[:limit]]
+
+
+WORD_RE = re.compile(r"[\w']+")
+
+
+def words(text):
+    return WORD_RE.findall(text.lower())
+
+
+class WordIndex:
+    """An inverted index from lowercase words to the strings containing them.
+
+    Parameters
+    -----------
+    items: iterable of str
+        What to search through.
+    """
+
+    def __init__(self, items=()):
+        self.items = list(items)
+
+        # word: [position in items]
+        self._postings = defaultdict(list)
+        for i, item in enumerate(self.items):
+            for word in set(words(item)):
+                self._postings[word].append(i)
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query):
+        """Every item containing all of the words in ``query``."""
+        postings = sorted(
+            (self._postings.get(word, ()) for word in set(words(query))),
+            key=len
+        )
+        if not postings or not postings[0]:
+            return []
+        if len(postings) == 1:
+            return [self.items[i] for i in postings[0]]
+
+        matches = set(postings[0])
+        for posting in postings[1:]:
+            matches.intersection_update(posting)
+        return [self.items[i] for i in sorted(matches)]
@@ -0,0 +1,156 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+import asyncio
+import heapq
+import time
+
+# how long a lockdown lasts if nobody says otherwise, in seconds
+DEFAULT_DURATION = 120
+
+
+class LockdownStore:
+    """Channel lockdowns keyed by channel id.
+
+    Looking a channel up is a dict access. Expired lockdowns are cleared by
+    :meth:`expire_forever`, which sleeps until the earliest expiry in a heap,
+    so entries don't hang around waiting for somebody to hit the channel again.
+    """
+
+    def __init__(self):
+        self._expires = {}
+        self._heap = []
+        self._wakeup = asyncio.Event()
+
+    def __contains__(self, channel_id):
+        return self.expires_at(channel_id) is not None
+
+    def __len__(self):
+        return len(self._expires)
+
+    def expires_at(self, channel_id):
+        """The timestamp a channel's lockdown ends at, or ``None``"""
+        expires = self._expires.get(channel_id)
+        if expires is None or expires <= time.time():
+            return None
+        return expires
+
+    def lock(self, channel_id, duration=DEFAULT_DURATION):
+        expires = time.time() + duration
+        self._expires[channel_id] = expires
+        heapq.heappush(self._heap, (expires, channel_id))
+
+        # in case this expires before whatever the task is sleeping on
+        self._wakeup.set()
+        return expires
+
+    def unlock(self, channel_id):
+        # the heap entry is skipped when it comes up
+        return self._expires.pop(channel_id, None) is not None
+
+    def expire(self):
+        """Drop every lockdown that has run out"""
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            expires, channel_id = heapq.heappop(self._heap)
+            # it might have been unlocked or re-locked since
+            if self._expires.get(channel_id) == expires:
+                del self._expires[channel_id]
+
+    async def expire_forever(self):
+        while True:
+            self.expire()
+            self._wakeup.clear()
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class RateWindow:
+    """Sliding window counter over the last ``limit`` hits.
+
+    The ring holds the times of the most recent hits, so the slot about to be
+    overwritten is the hit ``limit`` ago. If that is still inside the window,
+    there were ``limit`` hits in it.
+    """
+    __slots__ = ('times', 'index', 'last')
+
+    def __init__(self, limit):
+        self.times = [float('-inf')] * limit
+        self.index = 0
+        self.last = float('-inf')
+
+    def hit(self, now, per):
+        oldest = self.times[self.index]
+        self.times[self.index] = now
+        self.index = (self.index + 1) % len(self.times)
+        self.last = now
+        return now - oldest <= per
+
+
+class SpamDetector:
+    """Decides when a channel should be locked down automatically.
+
+    A channel trips if it sees ``channel_rate`` commands in ``per`` seconds,
+    or one user manages ``user_rate``. Each lockdown that follows soon after
+    the previous one ended lasts twice as long, up to ``max_duration``.
+    """
+
+    def __init__(self, *, channel_rate=15, user_rate=6, per=10.0,
+                 duration=DEFAULT_DURATION, max_duration=60 * 60,
+                 max_tracked=10000):
+        self.channel_rate = channel_rate
+        self.user_rate = user_rate
+        self.per = per
+        self.duration = duration
+        self.max_duration = max_duration
+        self.max_tracked = max_tracked
+        self.channels = {}
+        self.users = {}
+        # channel id -> (strikes, when the last lockdown ends)
+        self.strikes = {}
+
+    @staticmethod
+    def _window(windows, key, limit):
+        try:
+            return windows[key]
+        except KeyError:
+            w = windows[key] = RateWindow(limit)
+            return w
+
+    def _prune(self, windows, now):
+        if len(windows) > self.max_tracked:
+            for key in [k for k, w in windows.items()
+                        if now - w.last > self.per]:
+                del windows[key]
+
+    def hit(self, channel_id, user_id):
+        """Count one invocation. Returns whether the channel or user went
+        over their rate."""
+        now = time.time()
+
+        channel = self._window(self.channels, channel_id, self.channel_rate)
+        user = self._window(self.users, user_id, self.user_rate)
+        tripped = channel.hit(now, self.per) | user.hit(now, self.per)
+
+        self._prune(self.channels, now)
+        self._prune(self.users, now)
+
+        return tripped
+
+    def strike(self, channel_id):
+        """Record that a lockdown is starting and return how long it should
+        last. Only call this when a lockdown actually starts, or one burst
+        racks up several strikes."""
+        now = time.time()
+        strikes, ended = self.strikes.get(channel_id, (0, 0.0))
+        if now - ended > self.max_duration:
+            # it's been quiet for long enough, start over
+            strikes = 0
+
+        duration = min(self.duration * 2 ** strikes, self.max_duration)
+        self.strikes[channel_id] = (strikes + 1, now + duration)
+        return duration
@@ -0,0 +1,199 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# The actual drawing for the meme commands. These are plain functions that
+# take decoded images and return PNG bytes, so they can run on the renderer's
+# threads instead of the event loop. Don't touch anything discord in here.
+import textwrap
+from math import floor
+
+from PIL import Image, ImageDraw
+
+from cogs.utils.images import to_png
+
+FONT = 'Arial.ttf'
+
+
+def blame(fonts, img, emoji, message):
+    """``emoji`` should already be 20% bigger than ``img``, see
+    :func:`blame_emoji_size`."""
+    # make the image 3 times larger than the avatar
+    large_image = Image.new('RGBA', [3 * x for x in img.size], (0,) * 4)
+    lW, lH = large_image.size
+    W, H = img.size
+    # the center box for the avatar
+    box = (W, H, W * 2, H * 2)
+
+    eW, eH = emoji.size
+
+    large_image.paste(img, box)
+    large_image.paste(
+        emoji,
+
+        (  # center the emoji
+            floor((lW - eW) / 2),
+
+            floor((lH - eH) / 2)
+        ),
+
+        emoji
+    )
+
+    # make the font size relative to the avatar size
+    fnt = fonts.get(FONT, floor(img.size[0] / 4))
+    d = ImageDraw.Draw(large_image)
+
+    tW, tH = d.textsize(message, fnt)
+
+    d.text(
+        (  # center the text
+            floor((lW - tW) / 2),
+            # make the text somewhat centered (a bit offset so it
+            # looks good) in the first "row"
+            floor(H / 2) - floor(W / 4)
+        ),
+        message,
+        font=fnt,
+        fill=(255,) * 4
+    )
+
+    return to_png(large_image)
+
+
+def blame_emoji_size(img):
+    # make the emoji 20% bigger than the avatar
+    return tuple(floor(x * 1.2) for x in img.size)
+
+
+def the_floor(templates, fonts, img, what):
+    meme_format = templates.get('floor.png')
+
+    # == Text ==
+    fnt = fonts.get(FONT, 30)
+    d = ImageDraw.Draw(meme_format)
+
+    margin = 20
+    offset = 25
+    for line in textwrap.wrap(f'The floor is {what}', width=65):
+        d.text((margin, offset), line, font=fnt, fill=(0,) * 3)
+        offset += fnt.getsize(line)[1]
+
+    # == Avatars ==
+    first = img.resize((20, 20))
+    second = img.resize((40, 40))
+
+    meme_format.paste(first, (143, 135))
+    meme_format.paste(second, (465, 133))
+
+    return to_png(meme_format)
+
+
+def highway(templates, fonts, img, first_option, second_option):
+    meme_format = templates.get('highway.jpg')
+
+    # == Text one ==
+    fnt = fonts.get(FONT, 22)
+    d = ImageDraw.Draw(meme_format)
+
+    margin = 165
+    offset = 80
+    for line in textwrap.wrap(first_option, width=9):
+        d.text((margin, offset), line, font=fnt, fill=(255,) * 3)
+        offset += fnt.getsize(line)[1]
+
+    # == Text two ==
+
+    margin = 380
+    offset = 80
+    for line in textwrap.wrap(second_option, width=9):
+        d.text((margin, offset), line, font=fnt, fill=(255,) * 3)
+        offset += fnt.getsize(line)[1]
+
+    # == Image ==
+    meme_format.paste(img.resize((50, 50)), (340, 430))
+
+    return to_png(meme_format)
+
+
+def wheeze(templates, fonts, message):
+    meme_format = templates.get('wheeze.png')
+
+    # == Text ==
+    fnt = fonts.get(FONT, 20)
+    d = ImageDraw.Draw(meme_format)
+
+    d.text((34, 483), message, font=fnt, fill=(0,) * 3)
+
+    return to_png(meme_format)
+
+
+def trash(templates, fonts, first, second):
+    """``first`` and ``second`` are each either an image or some text."""
+    meme_format = templates.get('garbage.jpg', 'RGBA')
+
+    # == Text/Avatars 1==
+    if isinstance(first, str):
+        fnt = fonts.get(FONT, 50)
+        d = ImageDraw.Draw(meme_format)
+
+        margin = 440
+        offset = 35
+        for line in textwrap.wrap(first, width=4):
+            d.text((margin, offset), line, font=fnt, fill=(255,) * 3)
+            offset += fnt.getsize(line)[1]
+    else:
+        first = first.resize((180, 180))
+        first = first.rotate(20, expand=True)
+        meme_format.paste(first, (390, 15), first)
+
+    # == Text/Avatars 2 ==
+    if isinstance(second, str):
+        fnt = fonts.get(FONT, 50)
+        d = ImageDraw.Draw(meme_format)
+
+        margin = 720
+        offset = 170
+        for line in textwrap.wrap(second, width=5):
+            d.text((margin, offset), line, font=fnt, fill=(0,) * 3)
+            offset += fnt.getsize(line)[1]
+    else:
+        second = second.resize((250, 250))
+        second = second.rotate(-10, expand=True)
+        meme_format.paste(second, (620, 150), second)
+
+    return to_png(meme_format)
+
+
+def captcha(templates, fonts, img, name):
+    meme_format = templates.get('captcha.png')
+
+    # == Images ==
+    img = img.resize((129, 129))
+
+    for x_mul in range(3):
+        for y_mul in range(3):
+            meme_format.paste(img, (27 + 129 * x_mul, 173 + 129 * y_mul))
+
+    # == Text ==
+    fnt = fonts.get(FONT, 30)
+    d = ImageDraw.Draw(meme_format)
+
+    d.text((51, 90), name, font=fnt, fill=(255,) * 3)
+
+    return to_png(meme_format)
+
+
+def color_swatch(colors):
+    """One 256x256 square per ``(r, g, b)`` color, side by side."""
+    # Each square is 256 by 256
+    width = 256 * len(colors)
+
+    # background is same color as start to be lazy
+    image = Image.new('RGB', (width, 256), colors[0])
+    draw = ImageDraw.Draw(image)
+
+    for i in range(1, len(colors)):
+        draw.rectangle((256 * i, 0, 256 * (i + 1), 256), colors[i])
+
+    return to_png(image)
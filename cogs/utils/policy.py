@@ -0,0 +1,225 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# Everything the bot calls out to goes through one of these, so a service
+# that's down fails fast instead of hanging every command that uses it.
+import asyncio
+import time
+
+from discord.ext import commands
+
+# name: (display name, requests per second, burst, concurrent calls,
+#        total timeout in seconds)
+SERVICES = {
+    'wolfram': ('Wolfram|Alpha', 1, 5, 4, 45),
+    'duckduckgo': ('DuckDuckGo', 2, 5, 4, 15),
+    'urban': ('Urban Dictionary', 2, 5, 4, 15),
+    'chucknorris': ('chucknorris.io', 2, 5, 4, 15),
+    'yomomma': ('yomomma.info', 2, 5, 4, 15),
+    'icanhazdadjoke': ('icanhazdadjoke', 2, 5, 4, 15),
+    'hastebin': ('Hastebin', 1, 5, 2, 20),
+    'github': ('GitHub', 1, 5, 4, 20),
+    'swift_forums': ('the Swift forums', 1, 3, 2, 15),
+    'reddit': ('Reddit', 1, 10, 4, 60),
+    # the flair index, gamma counts and wiki list refreshing themselves, kept
+    # apart so a slow background pass can't trip the breaker for commands
+    'reddit_background': ('Reddit', 0.5, 5, 2, 120),
+}
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class ServiceUnavailable(commands.CommandError):
+    """Raised instead of calling a service that is down or overloaded."""
+
+    def __init__(self, service, reason):
+        self.service = service
+        super().__init__(f"{service.display_name} {reason} right now. "
+                         f"Try again in a bit!")
+
+
+class TokenBucket:
+    """Allows ``rate`` calls a second on average, and up to ``burst`` at
+    once."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def cancel(self):
+        self.tokens += 1
+
+
+class CircuitBreaker:
+    """Stops calling something after ``threshold`` failures in a row.
+
+    After ``reset_timeout`` seconds one call is let through to see if things
+    are better. If it works everything goes back to normal, otherwise it
+    waits again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and \
+                time.monotonic() - self.opened_at >= self.reset_timeout:
+            # only one caller gets to try
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def abandon(self):
+        """The trial call never happened, so let the next one try."""
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class Service:
+    """Rate limit, concurrency cap, timeout and circuit breaker for one
+    service.
+
+    Parameters
+    -----------
+    name: str
+        What it's called in stats.
+    display_name: str
+        What it's called when telling users it's down.
+    rate: float
+        Calls allowed per second, on average.
+    burst: int
+        Calls allowed at once before the rate kicks in.
+    concurrency: int
+        Calls allowed in flight at once.
+    timeout: float
+        Total time a call gets, including waiting for its turn.
+    """
+
+    def __init__(self, name, display_name, rate, burst, concurrency, timeout):
+        self.name = name
+        self.display_name = display_name
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.rejected = 0
+
+    def _reject(self, reason):
+        self.rejected += 1
+        return ServiceUnavailable(self, reason)
+
+    async def call(self, func, *args, timeout=None, failed=None,
+                   expected=(), **kwargs):
+        """Await ``func(*args, **kwargs)`` under this service's policy.
+
+        Raises :exc:`ServiceUnavailable` if the breaker is open or the call
+        can't start in time, and :exc:`asyncio.TimeoutError` if it starts but
+        runs out of time. ``failed`` is an optional function that decides if
+        a result counts as a failure, like a 503 response. Exceptions in
+        ``expected`` are perfectly good answers (like a 404) and don't count
+        as failures.
+        """
+        if not self.breaker.allow():
+            raise self._reject("isn't responding")
+
+        try:
+            result = await self._call(func, args, kwargs, timeout)
+        except (ServiceUnavailable, asyncio.CancelledError):
+            self.breaker.abandon()
+            raise
+        except expected:
+            self.breaker.success()
+            raise
+        except Exception:
+            self.breaker.failure()
+            raise
+
+        if failed is not None and failed(result):
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return result
+
+    async def _call(self, func, args, kwargs, timeout):
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        delay = self.bucket.reserve()
+        if time.monotonic() + delay >= deadline:
+            self.bucket.cancel()
+            raise self._reject('is getting too many requests')
+        if delay:
+            await asyncio.sleep(delay)
+
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(),
+                                   deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            raise self._reject('is too busy') from None
+
+        self.calls += 1
+        try:
+            return await asyncio.wait_for(func(*args, **kwargs),
+                                          deadline - time.monotonic())
+        finally:
+            self.semaphore.release()
+
+
+class Services:
+    """Every :class:`Service`, available as ``bot.services``."""
+
+    def __init__(self, services=SERVICES):
+        self._services = {
+            name: Service(name, *args) for name, args in services.items()
+        }
+
+    def __getitem__(self, name):
+        return self._services[name]
+
+    def __iter__(self):
+        return iter(self._services.values())
+
+    def stats(self):
+        result = {}
+        for service in self:
+            label = f'{{service="{service.name}"}}'
+            result[f'state{label}'] = service.breaker.state
+            result[f'trips{label}'] = service.breaker.trips
+            result[f'calls{label}'] = service.calls
+            result[f'rejected{label}'] = service.rejected
+        return result
@@ -0,0 +1,61 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# Resolving prefixes used to rebuild the whole prefix list and try every entry
+# one by one for every single message. This does all that once per guild.
+import re
+
+from discord.ext.commands.view import StringView
+
+
+class PrefixMatcher:
+    """Precompiled prefix lookup for one guild (or DMs).
+
+    Built from the ``[prefix, is_regex]`` pairs returned by
+    ``TorGenius.get_guild_prefixes``. Regex prefixes keep their priority over
+    plain ones, and plain prefixes are folded into a single alternation that
+    tries them in the same order ``discord.utils.find`` used to.
+    """
+
+    __slots__ = ('regexes', 'literals', '_literal_re')
+
+    def __init__(self, prefixes):
+        self.regexes = [(p, re.compile(p[0])) for p in prefixes if p[1]]
+        self.literals = [p[0] for p in prefixes if not p[1]]
+
+        if self.literals:
+            self._literal_re = re.compile(
+                '|'.join(re.escape(p) for p in self.literals)
+            )
+        else:
+            self._literal_re = None
+
+    def match(self, content):
+        """Find the prefix a message was invoked with.
+
+        Returns a ``(prefix, view)`` tuple where ``view`` is a
+        :class:`StringView` positioned right after the prefix, or ``None`` if
+        nothing matches.
+        """
+        for prefix, regex in self.regexes:
+            reg = regex.match(content)
+            if reg:
+                if content == reg.group(1):
+                    # ignore * prefixes
+                    continue
+
+                # redo the string view with the capture group
+                return prefix, StringView(reg.group(1))
+
+        if self._literal_re is None:
+            return None
+
+        reg = self._literal_re.match(content)
+        if reg is None:
+            return None
+
+        prefix = reg.group(0)
+        view = StringView(content)
+        view.skip_string(prefix)
+        return prefix, view
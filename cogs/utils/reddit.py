@@ -0,0 +1,212 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# PRAW is completely blocking, so every call goes through here instead of
+# running right on the event loop.
+import asyncio
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+Post = namedtuple('Post', 'fullname title permalink flair')
+
+
+class RedditWorker:
+    """Runs PRAW calls on a small dedicated thread pool.
+
+    At most ``max_workers`` calls run at once and only so many more can wait
+    for a thread, so a pile of slow Reddit commands can't take every thread
+    the bot has. Every call has a timeout, but a call that times out still
+    holds its place until its thread is actually done with it.
+
+    PRAW's session, rate limiter and auth aren't thread safe, so every thread
+    makes its own client with ``factory`` and passes it to whatever it runs.
+
+    Parameters
+    -----------
+    factory
+        Called with no arguments to make a :class:`praw.Reddit`.
+    max_workers: int
+        Threads reserved for Reddit.
+    timeout: float
+        Default timeout for a call, in seconds.
+    service: :class:`cogs.utils.policy.Service`
+        Rate limit and circuit breaker every call goes through, if any.
+    background_service: :class:`cogs.utils.policy.Service`
+        What calls made with ``background=True`` go through instead, so
+        background work doesn't count towards ``service``'s breaker.
+    """
+
+    def __init__(self, factory, *, loop=None, max_workers=4, timeout=30.0,
+                 service=None, background_service=None):
+        self.factory = factory
+        self.loop = loop or asyncio.get_event_loop()
+        self.timeout = timeout
+        self.service = service
+        self.background_service = background_service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='reddit')
+        self._slots = asyncio.Semaphore(max_workers * 4)
+        self._local = threading.local()
+
+    async def run(self, func, *args, timeout=None, expected=(),
+                  background=False, **kwargs):
+        """Run ``func(reddit, *args, **kwargs)`` in the pool, where
+        ``reddit`` is that thread's client, and wait for the result.
+
+        Raises :exc:`asyncio.TimeoutError` if it takes too long. The caller
+        gets to move on right away, but a call already running in a thread
+        can't be interrupted. Use :meth:`run_cancellable` for long loops.
+
+        ``expected`` is passed on to :meth:`Service.call`. Pass
+        ``background=True`` for work nobody is waiting on.
+        """
+        service = self.background_service if background else self.service
+        if service is None:
+            return await self._run(func, args, kwargs, timeout)
+        return await service.call(
+            self._run, func, args, kwargs, timeout,
+            timeout=timeout or self.timeout, expected=expected
+        )
+
+    async def _run(self, func, args, kwargs, timeout):
+        await self._slots.acquire()
+        try:
+            future = self.executor.submit(self._call, func, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        # released when the thread finishes, not when we stop waiting
+        future.add_done_callback(
+            lambda _: self.loop.call_soon_threadsafe(self._slots.release)
+        )
+        return await asyncio.wait_for(
+            asyncio.wrap_future(future, loop=self.loop),
+            timeout or self.timeout
+        )
+
+    def _call(self, func, args, kwargs):
+        # runs on the worker thread
+        reddit = getattr(self._local, 'reddit', None)
+        if reddit is None:
+            reddit = self._local.reddit = self.factory()
+        return func(reddit, *args, **kwargs)
+
+    async def run_cancellable(self, func, *args, timeout=None, expected=(),
+                              background=False, **kwargs):
+        """Like :meth:`run`, but ``func`` is also passed a
+        :class:`threading.Event` right after the client. It's set if the
+        caller times out or is cancelled, and ``func`` should stop whatever
+        it's iterating over when it sees it."""
+        cancelled = threading.Event()
+        try:
+            return await self.run(func, cancelled, *args, timeout=timeout,
+                                  expected=expected, background=background,
+                                  **kwargs)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            cancelled.set()
+            raise
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class FlairIndex:
+    """The newest ``size`` submissions on a subreddit, grouped by flair.
+
+    Nothing in here touches the network. Something else fetches new posts and
+    current flairs (see the Reddit cog) and feeds them in with :meth:`add` and
+    :meth:`update_flairs`.
+    """
+
+    def __init__(self, size=500):
+        self.size = size
+        # fullname: Post, newest first
+        self.posts = OrderedDict()
+        # flair: {fullname}
+        self.by_flair = defaultdict(set)
+        self.updated_at = None
+        # reddit requests flair_count would have made without the index, and
+        # the ones keeping it up to date actually made
+        self.api_calls_avoided = 0
+        self.api_calls_spent = 0
+
+    @property
+    def ready(self):
+        return self.updated_at is not None
+
+    def age(self):
+        """Seconds since the last refresh, or ``None`` if there hasn't been
+        one."""
+        if self.updated_at is None:
+            return None
+        return time.monotonic() - self.updated_at
+
+    def _remove(self, fullname):
+        post = self.posts.pop(fullname)
+        bucket = self.by_flair[post.flair]
+        bucket.discard(fullname)
+        if not bucket:
+            del self.by_flair[post.flair]
+
+    def add(self, posts):
+        """Add the newest posts, newest first the way reddit lists them. Posts
+        we already know about are updated in place, so overlapping listings
+        are fine."""
+        for post in reversed(posts):
+            if post.fullname in self.posts:
+                self._remove(post.fullname)
+            self.posts[post.fullname] = post
+            self.posts.move_to_end(post.fullname, last=False)
+            self.by_flair[post.flair].add(post.fullname)
+
+        while len(self.posts) > self.size:
+            self._remove(next(reversed(self.posts)))
+
+    def reset(self, posts):
+        """Forget everything and start again from a full listing."""
+        self.posts.clear()
+        self.by_flair.clear()
+        self.add(posts)
+
+    def update_flairs(self, flairs, fullnames=None):
+        """Apply a ``fullname: flair`` mapping of current flairs for
+        ``fullnames``, or every post we know about. Any of those missing from
+        it are gone from reddit."""
+        for fullname in list(self.posts if fullnames is None else fullnames):
+            post = self.posts.get(fullname)
+            if post is None:
+                continue
+            if fullname not in flairs:
+                self._remove(fullname)
+            elif flairs[fullname] != post.flair:
+                self.by_flair[post.flair].discard(fullname)
+                if not self.by_flair[post.flair]:
+                    del self.by_flair[post.flair]
+                self.posts[fullname] = post._replace(flair=flairs[fullname])
+                self.by_flair[flairs[fullname]].add(fullname)
+
+    def mark_updated(self):
+        self.updated_at = time.monotonic()
+
+    def count(self, flair):
+        return len(self.by_flair.get(flair, ()))
+
+    def get(self, flair):
+        """Every post with ``flair``, newest first."""
+        bucket = self.by_flair.get(flair)
+        if not bucket:
+            return []
+        return [post for name, post in self.posts.items() if name in bucket]
+
+    def stats(self):
+        age = self.age()
+        return {
+            'posts': len(self.posts),
+            'flairs': len(self.by_flair),
+            'age_seconds': -1 if age is None else round(age, 1),
+            'api_calls_saved': self.api_calls_avoided - self.api_calls_spent
+        }
@@ -0,0 +1,94 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# Cogs used to each get their own on_message, so every message paid for every
+# cog's filter. Now they register with the router on the bot instead.
+import itertools
+import logging
+import re
+from collections import defaultdict, namedtuple
+
+log = logging.getLogger(__name__)
+
+Listener = namedtuple('Listener', 'id callback channel_id guild_id pattern')
+
+
+class MessageRouter:
+    """Dispatches messages to the listeners that care about them.
+
+    Listeners filter on exactly one of a channel id, a guild id or a regex
+    matched against the start of the content (``re.match`` semantics). Channel
+    and guild listeners are plain dict lookups. Each pattern is tried on its
+    own, so every listener whose pattern matches is called and patterns keep
+    their own flags, groups and backreferences.
+
+    Callbacks are coroutines taking the message, plus the match object for
+    pattern listeners.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.by_channel = defaultdict(list)
+        self.by_guild = defaultdict(list)
+        self.by_pattern = []
+        self._ids = itertools.count()
+
+    def register(self, callback, *, channel_id=None, guild_id=None,
+                 pattern=None):
+        """Add a listener, returning a handle for :meth:`unregister`"""
+        if sum(x is not None for x in (channel_id, guild_id, pattern)) != 1:
+            raise TypeError('Exactly one of channel_id, guild_id and pattern '
+                            'is required.')
+
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+
+        listener = Listener(next(self._ids), callback, channel_id, guild_id,
+                            pattern)
+
+        if channel_id is not None:
+            self.by_channel[channel_id].append(listener)
+        elif guild_id is not None:
+            self.by_guild[guild_id].append(listener)
+        else:
+            self.by_pattern.append(listener)
+
+        return listener
+
+    def unregister(self, listener):
+        if listener.channel_id is not None:
+            self.by_channel[listener.channel_id].remove(listener)
+        elif listener.guild_id is not None:
+            self.by_guild[listener.guild_id].remove(listener)
+        else:
+            self.by_pattern.remove(listener)
+
+    def listeners_for(self, message):
+        """Yield ``(listener, match)`` for everything interested in a message"""
+        for listener in self.by_channel.get(message.channel.id, ()):
+            yield listener, None
+
+        if message.guild is not None:
+            for listener in self.by_guild.get(message.guild.id, ()):
+                yield listener, None
+
+        for listener in self.by_pattern:
+            match = listener.pattern.match(message.content)
+            if match:
+                yield listener, match
+
+    def dispatch(self, message):
+        # one task per interested listener, same as discord.py's own dispatch
+        for listener, match in self.listeners_for(message):
+            self.bot.loop.create_task(self._run(listener, message, match))
+
+    async def _run(self, listener, message, match):
+        # noinspection PyBroadException
+        try:
+            if listener.pattern is None:
+                await listener.callback(message)
+            else:
+                await listener.callback(message, match)
+        except Exception:
+            await self.bot.on_error('on_message', message)
@@ -0,0 +1,163 @@
+# Copyright (c) 2017 Perry Fraser
+#
+# Licensed under the MIT License. https://opensource.org/licenses/MIT
+
+# Fixed bucket latency histograms for commands. Buckets are fixed so recording
+# is just a bisect and an increment, no matter how many samples there are.
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from discord.ext import commands
+
+# upper bounds in seconds, the last bucket catches everything else
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0, float('inf')
+)
+
+PHASES = ('prefix', 'checks', 'converters', 'callback', 'send', 'total')
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """Estimate a percentile (0-100) by interpolating inside a bucket"""
+        if not self.count:
+            return 0.0
+
+        rank = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = min(BUCKETS[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+        return self.max
+
+
+class Metrics:
+    """Per command, per phase histograms, plus anything else that wants to
+    show up in the ``stats`` command or the metrics dump.
+
+    Other parts of the bot can register gauges with :meth:`add_gauge`. A gauge
+    is a function returning a mapping of ``name: number``.
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.gauges = OrderedDict()
+
+    def histograms(self, name):
+        try:
+            return self.commands[name]
+        except KeyError:
+            h = self.commands[name] = {phase: Histogram() for phase in PHASES}
+            return h
+
+    def record(self, ctx, total):
+        timings = ctx.timings
+        histograms = self.histograms(ctx.command.qualified_name)
+
+        # send happens inside the callback, so take it out of there
+        timings['callback'] = max(
+            total - timings['checks'] - timings['converters'] - timings['send'],
+            0.0
+        )
+        timings['total'] = total
+
+        for phase in PHASES:
+            histograms[phase].observe(timings[phase])
+
+    def add_gauge(self, name, func):
+        self.gauges[name] = func
+
+    def remove_gauge(self, name):
+        self.gauges.pop(name, None)
+
+    def read_gauges(self):
+        result = OrderedDict()
+        for name, func in self.gauges.items():
+            for key, value in func().items():
+                result[f'{name}_{key}'] = value
+        return result
+
+    def to_text(self):
+        """Plaintext dump in the Prometheus exposition format"""
+        lines = [
+            '# TYPE torgenius_command_seconds histogram'
+        ]
+
+        for name, histograms in sorted(self.commands.items()):
+            for phase, h in histograms.items():
+                labels = f'command="{name}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append(
+                        f'torgenius_command_seconds_bucket'
+                        f'{{{labels},le="{le}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'torgenius_command_seconds_sum{{{labels}}} {h.sum}'
+                )
+                lines.append(
+                    f'torgenius_command_seconds_count{{{labels}}} {h.count}'
+                )
+
+        for key, value in self.read_gauges().items():
+            lines.append(f'torgenius_{key} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# These two are patched onto commands.Command by the stats cog so the checks
+# and converters get their own phase. Like tracking's on_error patch, the
+# originals are put back on teardown.
+_old_can_run = commands.Command.can_run
+_old_parse_arguments = commands.Command._parse_arguments
+
+
+async def _timed_can_run(self, ctx):
+    start = time.perf_counter()
+    try:
+        return await _old_can_run(self, ctx)
+    finally:
+        # the help paginator calls this for every command, ignore those
+        if ctx.command is self and hasattr(ctx, 'timings'):
+            ctx.timings['checks'] += time.perf_counter() - start
+
+
+async def _timed_parse_arguments(self, ctx):
+    start = time.perf_counter()
+    try:
+        return await _old_parse_arguments(self, ctx)
+    finally:
+        if hasattr(ctx, 'timings'):
+            ctx.timings['converters'] += time.perf_counter() - start
+
+
+def instrument():
+    commands.Command.can_run = _timed_can_run
+    commands.Command._parse_arguments = _timed_parse_arguments
+
+
+def uninstrument():
+    commands.Command.can_run = _old_can_run
+    commands.Command._parse_arguments = _old_parse_arguments
@@ -4,6 +4,7 @@
 # Licensed under the MIT License. https://opensource.org/licenses/MIT
 
 import asyncio
+import functools
 import importlib
 import logging
 import sys
@@ -15,7 +16,9 @@ import click
 
 import config
 from bot import TorGenius, initial_extensions
+from cogs.utils import bench as bench_utils, memes
 from cogs.utils.db import Table
+from cogs.utils.images import FontCache, Renderer
 
 
 @contextmanager
@@ -51,12 +54,19 @@ def setup_logging():
             log.removeHandler(each_handler)
 
 
-def run_bot():
+def run_bot(reddit=True, slow_callback=None):
     # who knows at this point
     # noinspection PyShadowingNames
     log = logging.getLogger()
     loop = asyncio.get_event_loop()
 
+    if slow_callback is not None:
+        # asyncio's debug mode logs every callback that holds the loop longer
+        # than this, which is how blocking calls sneak in
+        loop.set_debug(True)
+        loop.slow_callback_duration = slow_callback / 1000
+        logging.getLogger('asyncio').setLevel(logging.WARNING)
+
     # noinspection PyBroadException
     try:
         pool = loop.run_until_complete(
@@ -67,18 +77,23 @@ def run_bot():
         log.exception('Could not set up PostgreSQL. Exiting.')
         return
 
-    bot = TorGenius()
+    bot = TorGenius(reddit=reddit)
     bot.pool = pool
     bot.run()
 
 
 @click.group(invoke_without_command=True, options_metavar='[options]')
+@click.option('--no-reddit', help="don't set up Reddit or load cogs.reddit",
+              is_flag=True)
+@click.option('--debug', 'slow_callback', type=int, metavar='MS',
+              help='debug mode, logging callbacks that block the loop for '
+                   'longer than MS milliseconds')
 @click.pass_context
-def main(ctx):
+def main(ctx, no_reddit, slow_callback):
     """Launches the bot"""
     if ctx.invoked_subcommand is None:
         with setup_logging():
-            run_bot()
+            run_bot(reddit=not no_reddit, slow_callback=slow_callback)
 
 
 @main.group(short_help='database stuff', options_metavar='[options]')
@@ -136,5 +151,97 @@ def init(cogs, quiet):
             )
 
 
+@main.group(short_help='offline benchmarks', options_metavar='[options]')
+def bench():
+    pass
+
+
+@bench.command(short_help='replays messages through the command pipeline',
+               options_metavar='[options]')
+@click.option('-f', '--file', 'file', type=click.File('r'),
+              help='JSONL stream of messages, synthetic if not given')
+@click.option('-n', '--count', default=10000, show_default=True,
+              help='number of synthetic messages')
+@click.option('--seed', type=int, help='seed for the synthetic stream')
+@click.option('--warmup', default=500, show_default=True,
+              help='messages to run before measuring')
+@click.option('--allocations', is_flag=True,
+              help='trace allocations (slows everything down)')
+def replay(file, count, seed, warmup, allocations):
+    """Feed messages through get_context and process_commands with fake
+    guilds, channels and members. Nothing connects to Discord."""
+    loop = asyncio.get_event_loop()
+
+    if file is not None:
+        records = bench_utils.load_records(file)
+    else:
+        records = bench_utils.synthetic_records(count, seed=seed)
+
+    bot = TorGenius(reddit=False)
+    runner = bench_utils.Replay.prepare(bot)
+
+    if warmup:
+        loop.run_until_complete(runner.run(records[:warmup]))
+
+    result = loop.run_until_complete(
+        runner.run(records, allocations=allocations)
+    )
+    latencies = result['latencies']
+
+    click.echo(f'{result["messages"]} messages in {result["seconds"]:.3f}s '
+               f'({result["per_second"]:,.0f} messages/s)')
+    click.echo('latency: ' + ', '.join(
+        f'p{p} {bench_utils.percentile(latencies, p) * 1e6:.1f}us'
+        for p in (50, 95, 99)
+    ))
+    click.echo(f'stubbed HTTP calls: {result["http_calls"]}')
+
+    if allocations:
+        click.echo(f'traced memory: {result["current"] / 1024:.1f} KiB '
+                   f'current, {result["peak"] / 1024:.1f} KiB peak')
+
+
+@bench.command(short_help='compares inline and pooled meme rendering',
+               options_metavar='[options]')
+@click.option('-n', '--count', default=50, show_default=True,
+              help='number of renders')
+@click.option('-c', '--concurrency', default=8, show_default=True,
+              help='renders requested at once')
+@click.option('--size', default=1024, show_default=True,
+              help='avatar size in pixels')
+@click.option('--workers', default=2, show_default=True,
+              help='renderer threads')
+def render(count, concurrency, size, workers):
+    """Render blame memes of a big avatar, first inline on the event loop
+    like the bot used to and then on the renderer, and compare."""
+    loop = asyncio.get_event_loop()
+
+    fonts = FontCache()
+    fonts.preload(memes.FONT)
+    avatar = bench_utils.synthetic_avatar(size)
+    emoji = bench_utils.synthetic_avatar(240).resize(
+        memes.blame_emoji_size(avatar)
+    )
+    job = functools.partial(memes.blame, fonts, avatar, emoji, '#blamebench')
+
+    renderer = Renderer(loop=loop, max_workers=workers,
+                        max_jobs=concurrency, timeout=None)
+    try:
+        for name, pool in (('inline', None), ('pooled', renderer)):
+            result = loop.run_until_complete(bench_utils.render_load(
+                job, count, concurrency, renderer=pool
+            ))
+            stalls = result['stalls']
+            click.echo(
+                f'{name}: {result["jobs"]} renders in '
+                f'{result["seconds"]:.3f}s ({result["per_second"]:.1f}/s), '
+                f'loop stalls p99 '
+                f'{bench_utils.percentile(stalls, 99) * 1000:.1f}ms, '
+                f'max {(stalls[-1] if stalls else 0) * 1000:.1f}ms'
+            )
+    finally:
+        renderer.close()
+
+
 if __name__ == '__main__':
     main()